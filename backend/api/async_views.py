@@ -0,0 +1,94 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import JsonResponse
+from rest_framework.permissions import SAFE_METHODS
+
+
+class ReadPool:
+    """Ограниченный пул потоков для ORM из асинхронных представлений.
+
+    Одновременно выполняется не больше workers представлений, ещё
+    backlog запросов ждут своей очереди, остальные сразу получают 503.
+    """
+
+    def __init__(self, workers, backlog):
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='foodgram-read')
+        self.limit = workers + backlog
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.pending >= self.limit:
+                return False
+            self.pending += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.pending -= 1
+
+    async def run(self, func, *args):
+        context = copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, context.run, func, *args)
+
+
+read_pool = ReadPool(settings.ASYNC_DB_WORKERS, settings.ASYNC_DB_BACKLOG)
+
+
+def run_view(view, request, args, kwargs):
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if callable(getattr(response, 'render', None)):
+            response = response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    """Асинхронная обёртка синхронного представления.
+
+    Чтения (SAFE_METHODS) с рендерингом ответа выполняются в read_pool,
+    поток событийного цикла не блокируется ни ORM, ни медленным клиентом.
+    Изменяющие запросы к тем же маршрутам идут обычным синхронным путём
+    и не отклоняются вместе с чтениями при перегрузке.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return await sync_to_async(view)(request, *args, **kwargs)
+        if not read_pool.acquire():
+            response = JsonResponse(
+                {'detail': 'Сервер перегружен, повторите запрос позже.'},
+                status=503)
+            response['Retry-After'] = '1'
+            return response
+        try:
+            return await read_pool.run(run_view, view, request, args, kwargs)
+        finally:
+            read_pool.release()
+    return wrapper
+
+
+def async_read_routes(urlpatterns, names):
+    """Переводит маршруты с указанными именами на async_view.
+
+    Действует только в режиме ASGI (ASYNC_READ_VIEWS), под WSGI
+    маршруты остаются синхронными.
+    """
+    if settings.ASYNC_READ_VIEWS:
+        for pattern in urlpatterns:
+            if getattr(pattern, 'name', None) in names:
+                pattern.callback = async_view(pattern.callback)
+    return urlpatterns
@@ -0,0 +1,102 @@
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+TOKEN_KEY = 'auth:token:{}'
+
+
+class TokenCache:
+    """Токены с пользователями: LRU процесса поверх общего кэша.
+
+    Общий кэш сбрасывается сигналами сразу после коммита, локальные
+    записи других процессов живут не дольше AUTH_TOKEN_LOCAL_TIMEOUT.
+    Если кэш не общий между процессами (locmem), второго слоя нет:
+    иначе выход или смена пароля действовали бы только в одном
+    процессе до AUTH_TOKEN_CACHE_TIMEOUT.
+    Хранятся pickle-копии, чтобы запросы не делили один объект User.
+    """
+
+    def __init__(self, maxsize, timeout, shared):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.shared = shared
+        self.lock = threading.Lock()
+        self.tokens = OrderedDict()
+
+    @staticmethod
+    def get_shared_key(key):
+        return TOKEN_KEY.format(hashlib.sha256(key.encode()).hexdigest())
+
+    def remember(self, key, data):
+        with self.lock:
+            self.tokens[key] = (time.monotonic() + self.timeout, data)
+            self.tokens.move_to_end(key)
+            if len(self.tokens) > self.maxsize:
+                self.tokens.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            expires, data = self.tokens.get(key, (0, None))
+            if expires > time.monotonic():
+                self.tokens.move_to_end(key)
+                return pickle.loads(data)
+        if not self.shared:
+            return None
+        data = cache.get(self.get_shared_key(key))
+        if data is None:
+            return None
+        self.remember(key, data)
+        return pickle.loads(data)
+
+    def set(self, key, token):
+        data = pickle.dumps(token)
+        if self.shared:
+            cache.set(self.get_shared_key(key), data,
+                      settings.AUTH_TOKEN_CACHE_TIMEOUT)
+        self.remember(key, data)
+
+    def delete(self, key):
+        if self.shared:
+            cache.delete(self.get_shared_key(key))
+        with self.lock:
+            self.tokens.pop(key, None)
+
+
+token_cache = TokenCache(
+    settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_LOCAL_TIMEOUT,
+    settings.SHARED_CACHE)
+
+
+def invalidate_tokens(*keys):
+    """Сбрасывает закэшированные токены после коммита."""
+    def delete():
+        for key in keys:
+            token_cache.delete(key)
+    transaction.on_commit(delete)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к БД для уже известных токенов.
+
+    Активность пользователя проверяется и для токенов из кэша, как
+    в TokenAuthentication.
+    """
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, token)
+        elif not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+        return token.user, token
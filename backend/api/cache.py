@@ -0,0 +1,154 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rest_framework.response import Response
+
+from .db_routing import primary_if_recent
+from .metrics import count_cache_event
+
+CATALOG_VERSION_KEY = 'recipes:version:catalog'
+RECIPE_LIST_VERSION_KEY = 'recipes:version:list'
+RECIPE_VERSION_KEY = 'recipes:version:recipe:{}'
+AUTHOR_VERSION_KEY = 'recipes:version:author:{}'
+RESPONSE_KEY = 'recipes:response:{}:{}'
+TAGS_VERSION_KEY = 'tags:version'
+INGREDIENTS_VERSION_KEY = 'ingredients:version'
+
+
+def new_version():
+    """Версия -- момент изменения, поэтому не повторяется после вытеснения."""
+    return time.time_ns()
+
+
+def get_version_timeout():
+    """Срок жизни версии.
+
+    В общем кэше версия живёт до смены. В кэше процесса смену видит
+    только сам процесс, поэтому версия истекает через
+    CACHE_VERSION_LOCAL_TIMEOUT и создаётся заново: ответы, сохранённые
+    под старой версией, больше не читаются.
+    """
+    if settings.SHARED_CACHE:
+        return None
+    return settings.CACHE_VERSION_LOCAL_TIMEOUT
+
+
+def get_versions(*keys):
+    """Текущие версии по ключам, отсутствующие создаются на лету."""
+    versions = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, get_version_timeout())
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*keys):
+    cache.set_many(dict.fromkeys(keys, new_version()), get_version_timeout())
+
+
+def invalidate_recipes(*recipe_ids, lists=True):
+    """Сбрасывает кэш списков и деталей рецептов после коммита.
+
+    С lists=False сбрасываются только детали и фрагменты рецептов:
+    так меняются частые счётчики, ради которых не стоит терять
+    закэшированные страницы списка.
+    """
+    keys = [RECIPE_VERSION_KEY.format(pk) for pk in recipe_ids]
+    if lists:
+        keys.append(RECIPE_LIST_VERSION_KEY)
+    transaction.on_commit(lambda: bump_versions(*keys))
+
+
+def invalidate_author(author_id):
+    """Сбрасывает фрагменты всех рецептов автора и списки после коммита.
+
+    Детальные ответы для анонимов ключуются версией рецепта и могут
+    показывать старые данные автора до RECIPE_CACHE_TIMEOUT.
+    """
+    keys = (AUTHOR_VERSION_KEY.format(author_id), RECIPE_LIST_VERSION_KEY)
+    transaction.on_commit(lambda: bump_versions(*keys))
+
+
+def invalidate_catalog():
+    """Сбрасывает все закэшированные ответы с рецептами."""
+    transaction.on_commit(lambda: bump_versions(CATALOG_VERSION_KEY))
+
+
+def build_response_key(request, versions):
+    """Ключ из версий и нормализованных параметров запроса."""
+    params = sorted(
+        (name, sorted(request.query_params.getlist(name)))
+        for name in request.query_params
+    )
+    raw = repr((request.scheme, request.get_host(), request.path, params))
+    return RESPONSE_KEY.format(
+        '.'.join(map(str, versions)),
+        hashlib.md5(raw.encode()).hexdigest(),
+    )
+
+
+def cache_anonymous_response(method):
+    """Кэширует ответ действия ViewSet для анонимных пользователей.
+
+    Для detail-действий ключ зависит от версии рецепта, для остальных --
+    от версии списка рецептов.
+    """
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return method(self, request, *args, **kwargs)
+        if 'pk' in kwargs:
+            version_key = RECIPE_VERSION_KEY.format(kwargs['pk'])
+        else:
+            version_key = RECIPE_LIST_VERSION_KEY
+        versions = get_versions(CATALOG_VERSION_KEY, version_key)
+        primary_if_recent(*versions)
+        key = build_response_key(request, versions)
+        data = cache.get(key)
+        if data is not None:
+            count_cache_event('hit')
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        count_cache_event('miss')
+        response = method(self, request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RECIPE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+    return wrapper
+
+
+def conditional_catalog(version_key):
+    """ETag и Last-Modified справочника по его версии в кэше.
+
+    Ответ 304 отдаётся до выполнения запроса к БД.
+    """
+    def get_version(request):
+        if not hasattr(request, '_catalog_version'):
+            request._catalog_version, = get_versions(version_key)
+            primary_if_recent(request._catalog_version)
+        return request._catalog_version
+
+    def etag(request, *args, **kwargs):
+        raw = '{}:{}:{}'.format(
+            get_version(request),
+            request.get_full_path(),
+            request.META.get('HTTP_ACCEPT', ''),
+        )
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        return datetime.fromtimestamp(
+            get_version(request) / 10 ** 9, tz=timezone.utc)
+
+    return method_decorator(
+        condition(etag_func=etag, last_modified_func=last_modified))
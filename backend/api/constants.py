@@ -17,3 +17,7 @@ AMOUNT_INGREDIENT_MIN = 1
 AMOUNT_INGREDIENT_MAX = 50
 
 LIMIT_PAGE_SIZE = 6
+PAGINATION_MODE_PARAM = 'paginate'
+CURSOR_PAGINATION_MODE = 'cursor'
+
+BULK_IDS_MAX = 100
@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+STICKY_KEY = 'db:primary:{}'
+# Токены и сессии читаются только с основной БД: только что выданный
+# токен может ещё не дойти до реплики.
+PRIMARY_APPS = {'authtoken', 'sessions'}
+
+current = ContextVar('replica', default=None)
+
+
+class ReplicaHealth:
+    """Недоступная реплика исключается на REPLICA_RETRY_SECONDS."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.down_until = {}
+
+    def is_marked_down(self, alias):
+        return time.monotonic() < self.down_until.get(alias, 0)
+
+    def check(self, alias):
+        if self.is_marked_down(alias):
+            return False
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            logger.warning('Реплика %s недоступна, чтение идёт с основной БД',
+                           alias, exc_info=True)
+            with self.lock:
+                self.down_until[alias] = (
+                    time.monotonic() + settings.REPLICA_RETRY_SECONDS)
+            return False
+        return True
+
+
+health = ReplicaHealth()
+
+
+class ReplicaRouter:
+    """Чтения безопасных запросов -- с реплики, выбранной middleware."""
+
+    def db_for_read(self, model, **hints):
+        alias = current.get()
+        if alias is None or model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+        return alias if health.check(alias) else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+def get_sticky_key(request):
+    credential = (request.META.get('HTTP_AUTHORIZATION')
+                  or request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    if credential:
+        return STICKY_KEY.format(
+            hashlib.sha256(credential.encode()).hexdigest())
+    return None
+
+
+def choose_replica(request):
+    """Реплика для запроса или None, если читать надо с основной БД.
+
+    После изменяющего запроса клиент на REPLICA_STICKY_SECONDS
+    закрепляется за основной БД и видит свои изменения.
+    """
+    if request.method not in SAFE_METHODS:
+        return None
+    replicas = [alias for alias in settings.REPLICA_DATABASES
+                if not health.is_marked_down(alias)]
+    if not replicas:
+        return None
+    key = get_sticky_key(request)
+    if key is not None and cache.get(key):
+        return None
+    return random.choice(replicas)
+
+
+def remember_write(request):
+    if request.method not in SAFE_METHODS and settings.REPLICA_DATABASES:
+        key = get_sticky_key(request)
+        if key is not None:
+            cache.set(key, True, settings.REPLICA_STICKY_SECONDS)
+
+
+def primary_if_recent(*versions):
+    """Оставшиеся чтения запроса -- с основной БД, если данные менялись
+    позже, чем REPLICA_STICKY_SECONDS назад.
+
+    Версии -- моменты изменений из api.cache. Ответ, прочитанный
+    с отстающей реплики, иначе закэшировался бы под новой версией.
+    """
+    if current.get() is None:
+        return
+    age = time.time_ns() - max(versions)
+    if age < settings.REPLICA_STICKY_SECONDS * 10 ** 9:
+        current.set(None)
+
+
+@sync_and_async_middleware
+def replica_middleware(get_response):
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = current.set(choose_replica(request))
+            try:
+                response = await get_response(request)
+            finally:
+                current.reset(token)
+            remember_write(request)
+            return response
+    else:
+        def middleware(request):
+            token = current.set(choose_replica(request))
+            try:
+                response = get_response(request)
+            finally:
+                current.reset(token)
+            remember_write(request)
+            return response
+    return middleware
@@ -0,0 +1,55 @@
+import binascii
+import uuid
+from base64 import b64decode
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files import File
+from rest_framework import serializers
+
+BASE64_MARKER = ';base64,'
+# Кратно 4 символам, чтобы каждый кусок декодировался независимо.
+BASE64_CHUNK_SIZE = 64 * 1024
+IMAGE_EXTENSIONS = ('jpeg', 'jpg', 'png', 'gif', 'webp')
+
+
+def decode_base64_image(data, max_size):
+    """Декодирует data URI по частям во временный файл.
+
+    Размер проверяется по длине строки до декодирования.
+    """
+    try:
+        start = data.index(BASE64_MARKER) + len(BASE64_MARKER)
+    except ValueError:
+        raise serializers.ValidationError('Картинка должна быть в base64.')
+    header = data[:start - len(BASE64_MARKER)]
+    ext = header.split(';')[0].split('/')[-1].lower()
+    if ext not in IMAGE_EXTENSIONS:
+        raise serializers.ValidationError(
+            f'Допустимые форматы картинки: {", ".join(IMAGE_EXTENSIONS)}.')
+    if (len(data) - start) * 3 // 4 > max_size:
+        raise serializers.ValidationError(
+            f'Картинка больше {max_size // (1024 * 1024)} МБ.')
+    file = SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    try:
+        for position in range(start, len(data), BASE64_CHUNK_SIZE):
+            file.write(b64decode(
+                data[position:position + BASE64_CHUNK_SIZE], validate=True))
+    except (binascii.Error, ValueError):
+        file.close()
+        raise serializers.ValidationError('Некорректные данные base64.')
+    file.seek(0)
+    return File(file, name=f'{uuid.uuid4()}.{ext}')
+
+
+class Base64ImageField(serializers.ImageField):
+    """Картинка из data URI в JSON или файлом из multipart-запроса."""
+
+    def to_internal_value(self, data):
+        max_size = settings.MAX_IMAGE_UPLOAD_SIZE
+        if isinstance(data, str) and data.startswith('data:image'):
+            data = decode_base64_image(data, max_size)
+        elif getattr(data, 'size', 0) > max_size:
+            raise serializers.ValidationError(
+                f'Картинка больше {max_size // (1024 * 1024)} МБ.')
+        return super().to_internal_value(data)
@@ -2,6 +2,7 @@ from django_filters import rest_framework as filters
 from django_filters.rest_framework import FilterSet
 
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import search_recipes
 from users.models import User
 
 
@@ -19,10 +20,12 @@ class RecipeFilter(FilterSet):
         to_field_name='slug',
         queryset=Tag.objects.all(),
     )
+    search = filters.CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
-        fields = ('is_favorited', 'author', 'is_in_shopping_cart', 'tags')
+        fields = (
+            'is_favorited', 'author', 'is_in_shopping_cart', 'tags', 'search')
 
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
@@ -34,6 +37,9 @@ class RecipeFilter(FilterSet):
             return queryset.filter(shopping_list__user=self.request.user)
         return queryset
 
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
 
 class IngredientFilter(FilterSet):
     """Фильтрация ингредиента по названию."""
@@ -0,0 +1,87 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch, prefetch_related_objects
+
+from recipes.models import IngredientRecipe
+
+from .cache import (AUTHOR_VERSION_KEY, CATALOG_VERSION_KEY,
+                    RECIPE_VERSION_KEY, get_versions)
+from .db_routing import current, primary_if_recent
+
+FRAGMENT_KEY = 'recipes:fragment:{}:{}:{}'
+# Поля ответа, которые зависят от пользователя и не хранятся в кэше.
+VIEWER_FIELDS = ('is_favorited', 'is_in_shopping_cart')
+
+
+def get_recipe_prefetches():
+    return (
+        'tags',
+        Prefetch(
+            'recipe_ingredients',
+            queryset=IngredientRecipe.objects.select_related('ingredient')
+        ),
+    )
+
+
+def get_fragment_keys(request, recipes):
+    """Ключи фрагментов по версиям рецептов и их авторов, одним
+    обращением к кэшу.
+
+    В ключ входит хост: ссылки на картинки в ответе абсолютные.
+    Рецепты, изменённые за последние REPLICA_STICKY_SECONDS, могли быть
+    прочитаны с отстающей реплики -- их ключ None, фрагмент не
+    сохраняется.
+    """
+    recipe_keys = [RECIPE_VERSION_KEY.format(recipe.pk) for recipe in recipes]
+    author_keys = list(dict.fromkeys(
+        AUTHOR_VERSION_KEY.format(recipe.author_id) for recipe in recipes))
+    catalog_version, *versions = get_versions(
+        CATALOG_VERSION_KEY, *recipe_keys, *author_keys)
+    versions = dict(zip(recipe_keys + author_keys, versions))
+    origin = hashlib.md5(
+        f'{request.scheme}://{request.get_host()}'.encode()).hexdigest()
+    fresh_since = time.time_ns() - settings.REPLICA_STICKY_SECONDS * 10 ** 9
+    on_replica = current.get() is not None
+    if versions:
+        primary_if_recent(catalog_version, *versions.values())
+    keys = {}
+    for recipe, recipe_key in zip(recipes, recipe_keys):
+        recipe_versions = (
+            catalog_version,
+            versions[recipe_key],
+            versions[AUTHOR_VERSION_KEY.format(recipe.author_id)],
+        )
+        keys[recipe.pk] = (
+            None if on_replica and max(recipe_versions) > fresh_since
+            else FRAGMENT_KEY.format(
+                recipe.pk, '.'.join(map(str, recipe_versions)), origin)
+        )
+    return keys
+
+
+def get_fragments(request, recipes, serialize):
+    """Общая для всех пользователей часть ответа по каждому рецепту.
+
+    Найденные фрагменты читаются одним get_many. Для остальных рецептов
+    догружаются теги и ингредиенты, serialize строит фрагмент, и он
+    сохраняется set_many.
+    """
+    keys = get_fragment_keys(request, recipes)
+    cached = cache.get_many([key for key in keys.values() if key])
+    fragments = {
+        pk: cached[key] for pk, key in keys.items() if key in cached
+    }
+    missing = [recipe for recipe in recipes if recipe.pk not in fragments]
+    if missing:
+        prefetch_related_objects(missing, *get_recipe_prefetches())
+        built = {recipe.pk: serialize(recipe) for recipe in missing}
+        cache.set_many(
+            {keys[pk]: fragment for pk, fragment in built.items()
+             if keys[pk]},
+            settings.RECIPE_FRAGMENT_TIMEOUT,
+        )
+        fragments.update(built)
+    return [fragments[recipe.pk] for recipe in recipes]
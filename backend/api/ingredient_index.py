@@ -0,0 +1,124 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count, Max
+
+from recipes.models import Ingredient
+
+from .cache import INGREDIENTS_VERSION_KEY, bump_versions, get_versions
+
+WORD_SEPARATOR = re.compile(r'[\s,()«»"-]+')
+
+# Неизменяемый снимок индекса: заменяется целиком одним присваиванием,
+# поэтому поиск не смешивает части старого и нового каталога.
+Snapshot = namedtuple('Snapshot', ('version', 'items', 'names', 'words'))
+EMPTY_SNAPSHOT = Snapshot(None, (), (), ())
+
+
+class IngredientIndex:
+    """Отсортированный индекс каталога ингредиентов в памяти процесса.
+
+    Сначала отдаются названия, начинающиеся с запроса (точное совпадение
+    оказывается первым), затем -- названия, в которых с запроса
+    начинается одно из следующих слов.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshot = EMPTY_SNAPSHOT
+        # Только без общего кэша: локальные сбросы и время последней
+        # сверки с БД.
+        self.generation = 0
+        self.checked_at = None
+
+    def build(self, version):
+        # Индекс живёт до следующей смены версии, реплика могла отстать.
+        items = sorted(
+            Ingredient.objects.using(DEFAULT_DB_ALIAS).values_list(
+                'name', 'measurement_unit', 'id'),
+            key=lambda item: (item[0].lower(), item[2]),
+        )
+        self.snapshot = Snapshot(
+            version=version,
+            items=tuple(
+                {'id': pk, 'name': name, 'measurement_unit': unit}
+                for name, unit, pk in items
+            ),
+            names=tuple(name.lower() for name, _, _ in items),
+            words=tuple(sorted(
+                (word, position)
+                for position, (name, _, _) in enumerate(items)
+                for word in WORD_SEPARATOR.split(name.lower())[1:]
+                if word
+            )),
+        )
+
+    def get_version(self):
+        """Версия каталога.
+
+        С общим кэшем -- версия из кэша, её меняет любой процесс.
+        Без него версию из кэша видит только сменивший её процесс,
+        поэтому раз в CACHE_VERSION_LOCAL_TIMEOUT (и сразу после
+        локального сброса) каталог сверяется с БД по числу записей
+        и наибольшему id: так видна загрузка ингредиентов командой
+        в другом процессе. Переименование в другом процессе так
+        не заметно -- для него нужен общий кэш.
+        """
+        if settings.SHARED_CACHE:
+            version, = get_versions(INGREDIENTS_VERSION_KEY)
+            return version
+        now = time.monotonic()
+        if (self.checked_at is not None and self.snapshot.version is not None
+                and now - self.checked_at
+                < settings.CACHE_VERSION_LOCAL_TIMEOUT):
+            return self.snapshot.version
+        self.checked_at = now
+        fingerprint = Ingredient.objects.using(DEFAULT_DB_ALIAS).aggregate(
+            count=Count('pk'), last_id=Max('pk'))
+        return (self.generation, fingerprint['count'], fingerprint['last_id'])
+
+    def invalidate(self):
+        """Помечает индекс процесса устаревшим."""
+        self.generation += 1
+        self.checked_at = None
+
+    def refresh(self):
+        """Перестраивает индекс, если каталог изменился."""
+        version = self.get_version()
+        if version != self.snapshot.version:
+            with self.lock:
+                if version != self.snapshot.version:
+                    self.build(version)
+
+    def search(self, prefix, limit):
+        self.refresh()
+        prefix = prefix.lower()
+        _, items, names, words = self.snapshot
+        found = []
+        position = bisect_left(names, prefix)
+        while (len(found) < limit and position < len(names)
+               and names[position].startswith(prefix)):
+            found.append(position)
+            position += 1
+        seen = set(found)
+        position = bisect_left(words, (prefix,))
+        while (len(found) < limit and position < len(words)
+               and words[position][0].startswith(prefix)):
+            if words[position][1] not in seen:
+                seen.add(words[position][1])
+                found.append(words[position][1])
+            position += 1
+        return [dict(items[index]) for index in found]
+
+
+ingredient_index = IngredientIndex()
+
+
+def invalidate_ingredient_index():
+    ingredient_index.invalidate()
+    bump_versions(INGREDIENTS_VERSION_KEY)
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SERVERS = {
+    'wsgi': ('foodgram.wsgi:application',),
+    'asgi': ('foodgram.asgi:application',
+             '--worker-class', 'uvicorn.workers.UvicornWorker'),
+}
+START_TIMEOUT = 30
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность WSGI (синхронные воркеры '
+            'gunicorn) и ASGI (uvicorn) на эндпоинтах чтения, пока '
+            'медленные клиенты держат открытые соединения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=tuple(SERVERS),
+                            default=tuple(SERVERS))
+        parser.add_argument('--url', default='/api/recipes/')
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Процессов gunicorn в каждом режиме.')
+        parser.add_argument('--clients', type=int, default=10,
+                            help='Обычных клиентов, шлющих запросы подряд.')
+        parser.add_argument('--slow-clients', type=int, default=20,
+                            help='Клиентов, передающих заголовки по байту.')
+        parser.add_argument('--slow-interval', type=float, default=0.5,
+                            help='Пауза между байтами медленного клиента.')
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--output', help='Сохранить результаты в JSON.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        results = []
+        for mode in options['modes']:
+            with self.server(mode):
+                result = asyncio.run(self.load())
+            result = {'mode': mode, 'url': options['url'], **result}
+            self.stdout.write(
+                '{mode}: {requests} ответов, {rps:.1f} rps, '
+                'p50 {p50_ms:.1f} мс, p95 {p95_ms:.1f} мс, '
+                '{errors} ошибок'.format(**result))
+            results.append(result)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2)
+
+    @contextmanager
+    def server(self, mode):
+        app, *extra = SERVERS[mode]
+        command = (
+            sys.executable, '-m', 'gunicorn', app, *extra,
+            '--bind', f'127.0.0.1:{self.options["port"]}',
+            '--workers', str(self.options['workers']),
+            '--log-level', 'warning',
+        )
+        environ = {**os.environ,
+                   'ASYNC_READ_VIEWS': 'true' if mode == 'asgi' else 'false'}
+        process = subprocess.Popen(
+            command, cwd=settings.BASE_DIR, env=environ)
+        try:
+            self.wait_for_port(process)
+            yield
+        finally:
+            process.terminate()
+            process.wait()
+
+    def wait_for_port(self, process):
+        deadline = time.monotonic() + START_TIMEOUT
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError('Сервер завершился при запуске.')
+            try:
+                socket.create_connection(
+                    ('127.0.0.1', self.options['port']), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError('Сервер не запустился за отведённое время.')
+
+    def request_head(self):
+        return (f'GET {self.options["url"]} HTTP/1.1\r\n'
+                f'Host: 127.0.0.1\r\n').encode()
+
+    async def slow_client(self, deadline):
+        """Держит соединение, передавая заголовки по одному байту."""
+        try:
+            _, writer = await asyncio.open_connection(
+                '127.0.0.1', self.options['port'])
+        except OSError:
+            return
+        try:
+            for byte in self.request_head():
+                if time.monotonic() >= deadline:
+                    break
+                writer.write(bytes((byte,)))
+                await writer.drain()
+                await asyncio.sleep(self.options['slow_interval'])
+            while time.monotonic() < deadline:
+                writer.write(b'X')
+                await writer.drain()
+                await asyncio.sleep(self.options['slow_interval'])
+        except OSError:
+            pass
+        finally:
+            writer.close()
+
+    async def client(self, deadline, timings, errors):
+        request = self.request_head() + b'Connection: close\r\n\r\n'
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(
+                        '127.0.0.1', self.options['port']),
+                    deadline - started)
+                writer.write(request)
+                response = await asyncio.wait_for(
+                    reader.read(), deadline - time.monotonic())
+                writer.close()
+            except asyncio.TimeoutError:
+                break
+            except OSError:
+                errors.append(None)
+                continue
+            if response.startswith(b'HTTP/1.1 200'):
+                timings.append((time.monotonic() - started) * 1000)
+            else:
+                errors.append(None)
+
+    async def load(self):
+        started = time.monotonic()
+        deadline = started + self.options['duration']
+        timings, errors = [], []
+        await asyncio.gather(
+            *(self.slow_client(deadline)
+              for _ in range(self.options['slow_clients'])),
+            *(self.client(deadline, timings, errors)
+              for _ in range(self.options['clients'])),
+        )
+        timings.sort()
+        return {
+            'requests': len(timings),
+            'errors': len(errors),
+            'rps': len(timings) / (time.monotonic() - started),
+            'p50_ms': statistics.median(timings) if timings else 0,
+            'p95_ms': timings[int(len(timings) * 0.95)] if timings else 0,
+        }
@@ -0,0 +1,110 @@
+import json
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+
+User = get_user_model()
+
+DEFAULT_SCALES = (10_000, 100_000, 1_000_000)
+USERS_PER_RECIPE = 0.1
+
+
+class Command(BaseCommand):
+    help = ('Наполняет БД до заданных объёмов рецептов и замеряет время '
+            'ответа и число SQL-запросов основных эндпоинтов. '
+            'Запускать только на отдельной БД!')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', type=int, nargs='+',
+                            default=DEFAULT_SCALES)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--output', help='Сохранить результаты в JSON.')
+        parser.add_argument('--keep-cache', action='store_true',
+                            help='Не сбрасывать кэш ответов между замерами.')
+        parser.add_argument('--yes', action='store_true',
+                            help='Подтвердить запись в текущую БД.')
+
+    def handle(self, *args, **options):
+        if not options['yes']:
+            raise CommandError(
+                'Команда пишет миллионы строк в текущую БД. '
+                'Запустите с --yes на отдельной базе.')
+        self.repeat = options['repeat']
+        self.keep_cache = options['keep_cache']
+        results = []
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for scale in sorted(options['scales']):
+                self.seed(scale)
+                results.extend(self.measure(scale))
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2)
+
+    def seed(self, scale):
+        missing = scale - Recipe.objects.count()
+        if missing > 0:
+            self.stdout.write(f'Наполнение до {scale} рецептов...')
+            call_command(
+                'seed_scale', recipes=missing,
+                users=max(int(missing * USERS_PER_RECIPE), 10),
+                stdout=self.stdout)
+
+    def get_endpoints(self, viewer):
+        author = User.objects.order_by('-recipes_count').first()
+        recipe = Recipe.objects.order_by('-favorites_count').first()
+        pages = Recipe.objects.count() // 6
+        return (
+            ('anonymous', '/api/recipes/'),
+            ('anonymous', f'/api/recipes/?page={max(pages // 2, 1)}'),
+            ('anonymous', '/api/recipes/?paginate=cursor'),
+            ('anonymous', f'/api/recipes/{recipe.pk}/'),
+            ('anonymous', f'/api/recipes/?author={author.pk}'),
+            ('anonymous', '/api/users/'),
+            ('viewer', '/api/recipes/'),
+            ('viewer', '/api/recipes/?is_favorited=1'),
+            ('viewer', f'/api/recipes/{recipe.pk}/'),
+            ('viewer', '/api/users/subscriptions/?recipes_limit=3'),
+            ('viewer', '/api/recipes/download_shopping_cart/'),
+        )
+
+    def measure(self, scale):
+        viewer = User.objects.annotate(
+            subscriptions=Count('follower')).order_by('-subscriptions').first()
+        clients = {'anonymous': APIClient(), 'viewer': APIClient()}
+        clients['viewer'].force_authenticate(viewer)
+        self.stdout.write(f'\n{scale} рецептов')
+        for role, url in self.get_endpoints(viewer):
+            timings = []
+            for _ in range(self.repeat):
+                if not self.keep_cache:
+                    cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = clients[role].get(url)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            result = {
+                'scale': scale,
+                'role': role,
+                'url': url,
+                'status': response.status_code,
+                'queries': len(queries),
+                'p50_ms': statistics.median(timings),
+                'p95_ms': timings[int(len(timings) * 0.95)],
+            }
+            self.stdout.write(
+                '{role:>9} {url:<48} {status} {queries:>3} запросов '
+                'p50 {p50_ms:8.1f} мс p95 {p95_ms:8.1f} мс'.format(**result))
+            yield result
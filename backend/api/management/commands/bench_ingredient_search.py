@@ -0,0 +1,71 @@
+import csv
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.filters import IngredientFilter
+from api.ingredient_index import IngredientIndex, invalidate_ingredient_index
+from recipes.models import Ingredient
+
+DEFAULT_CATALOG = settings.BASE_DIR.parent / 'data' / 'ingredients.csv'
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает поиск ингредиентов по началу названия через ORM '
+            'и через индекс в памяти.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--catalog', default=DEFAULT_CATALOG)
+        parser.add_argument('--prefix-length', type=int, nargs='+',
+                            default=(1, 2, 3, 5))
+        parser.add_argument('--limit', type=int,
+                            default=settings.INGREDIENT_SEARCH_LIMIT)
+
+    def handle(self, *args, **options):
+        with open(options['catalog'], encoding='utf-8') as file:
+            catalog = [(name, unit) for name, unit in csv.reader(file)]
+        prefixes = sorted({
+            name[:length].lower()
+            for name, _ in catalog
+            for length in options['prefix_length']
+        })
+        with transaction.atomic():
+            if not Ingredient.objects.exists():
+                Ingredient.objects.bulk_create(
+                    Ingredient(name=name, measurement_unit=unit)
+                    for name, unit in catalog
+                )
+            invalidate_ingredient_index()
+            index = IngredientIndex()
+            started = time.perf_counter()
+            index.refresh()
+            self.stdout.write(
+                f'{len(catalog)} ингредиентов, {len(prefixes)} префиксов, '
+                f'индекс построен за '
+                f'{(time.perf_counter() - started) * 1000:.1f} мс'
+            )
+            self.report('ORM', prefixes, lambda prefix: list(
+                IngredientFilter(
+                    {'name': prefix}, queryset=Ingredient.objects.all()
+                ).qs.values('id', 'name', 'measurement_unit')[
+                    :options['limit']]
+            ))
+            self.report('index', prefixes, lambda prefix: index.search(
+                prefix, options['limit']))
+            transaction.set_rollback(True)
+
+    def report(self, title, prefixes, search):
+        timings = []
+        for prefix in prefixes:
+            started = time.perf_counter()
+            search(prefix)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f'{title}: mean {statistics.mean(timings):.3f} мс, '
+            f'p95 {timings[int(len(timings) * 0.95)]:.3f} мс, '
+            f'total {sum(timings):.1f} мс'
+        )
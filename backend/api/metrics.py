@@ -0,0 +1,215 @@
+import asyncio
+import threading
+import time
+from collections import defaultdict
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.decorators import (api_view, permission_classes,
+                                       renderer_classes)
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.response import Response
+
+METRIC_PREFIX = 'foodgram'
+REQUEST_FIELDS = (
+    ('requests_total', 'Обработано запросов.'),
+    ('request_seconds_total', 'Суммарное время обработки запросов.'),
+    ('db_queries_total', 'Выполнено SQL-запросов.'),
+    ('db_seconds_total', 'Суммарное время SQL-запросов.'),
+    ('response_bytes_total', 'Отдано байт в теле ответа.'),
+)
+TIMER_FIELDS = (
+    ('timer_calls_total', 'Срабатываний именованного таймера.'),
+    ('timer_seconds_total', 'Суммарное время именованного таймера.'),
+)
+
+CACHE_EVENTS = ('hit', 'miss')
+
+lock = threading.Lock()
+request_metrics = defaultdict(lambda: dict.fromkeys(
+    (name for name, _ in REQUEST_FIELDS), 0))
+timer_metrics = defaultdict(lambda: dict.fromkeys(
+    (name for name, _ in TIMER_FIELDS), 0))
+current = ContextVar('request_metrics', default=None)
+cache_events = dict.fromkeys(CACHE_EVENTS, 0)
+
+
+class timed(ContextDecorator):
+    """Именованный таймер: контекстный менеджер и декоратор.
+
+    Время копится в рамках текущего запроса и попадает в метрики
+    вместе с его представлением и действием.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def _recreate_cm(self):
+        # Декорированная функция получает свой таймер на каждый вызов:
+        # started не делят потоки и вложенные вызовы.
+        return type(self)(self.name)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        metrics = current.get()
+        if metrics is not None:
+            calls, seconds = metrics.timers.get(self.name, (0, 0))
+            metrics.timers[self.name] = (
+                calls + 1, seconds + time.perf_counter() - self.started)
+
+
+class RequestMetrics:
+    """SQL-запросы и таймеры одного запроса.
+
+    Хранится в contextvar, поэтому виден и в потоках, куда запрос
+    передаётся вместе с контекстом (sync_to_async, пул чтения ASGI).
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0
+        self.timers = {}
+
+
+def record_query(execute, sql, params, many, context):
+    """Обёртка execute: считает SQL-запросы текущего запроса и их время."""
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.seconds += time.perf_counter() - started
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """Подключает record_query к каждому новому соединению с БД."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def count_cache_event(event):
+    """Попадание или промах кэша ответов с рецептами."""
+    with lock:
+        cache_events[event] += 1
+
+
+def get_view_labels(request):
+    match = request.resolver_match
+    if match is None:
+        return 'unresolved', request.method.lower()
+    view = getattr(match.func, 'cls', match.func)
+    actions = getattr(match.func, 'actions', None) or {}
+    return (
+        view.__name__,
+        actions.get(request.method.lower(), request.method.lower()),
+    )
+
+
+def store_metrics(request, response, metrics, elapsed):
+    labels = get_view_labels(request)
+    size = 0 if response.streaming else len(response.content)
+    with lock:
+        totals = request_metrics[labels]
+        totals['requests_total'] += 1
+        totals['request_seconds_total'] += elapsed
+        totals['db_queries_total'] += metrics.queries
+        totals['db_seconds_total'] += metrics.seconds
+        totals['response_bytes_total'] += size
+        for name, (calls, seconds) in metrics.timers.items():
+            timer = timer_metrics[(*labels, name)]
+            timer['timer_calls_total'] += calls
+            timer['timer_seconds_total'] += seconds
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Агрегирует по представлениям число и время запросов к БД,
+    время именованных таймеров и размер ответа.
+    """
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            metrics = RequestMetrics()
+            token = current.set(metrics)
+            started = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                current.reset(token)
+            store_metrics(
+                request, response, metrics, time.perf_counter() - started)
+            return response
+    else:
+        def middleware(request):
+            metrics = RequestMetrics()
+            token = current.set(metrics)
+            started = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                current.reset(token)
+            store_metrics(
+                request, response, metrics, time.perf_counter() - started)
+            return response
+    return middleware
+
+
+def format_labels(**labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels.items())
+
+
+def render_metrics():
+    """Метрики процесса в текстовом формате Prometheus."""
+    with lock:
+        requests = {labels: dict(values)
+                    for labels, values in request_metrics.items()}
+        timers = {labels: dict(values)
+                  for labels, values in timer_metrics.items()}
+        events = dict(cache_events)
+    lines = []
+    for field, description in REQUEST_FIELDS:
+        lines += [f'# HELP {METRIC_PREFIX}_{field} {description}',
+                  f'# TYPE {METRIC_PREFIX}_{field} counter']
+        for (view, action), values in sorted(requests.items()):
+            lines.append('{}_{}{{{}}} {}'.format(
+                METRIC_PREFIX, field,
+                format_labels(view=view, action=action), values[field]))
+    for field, description in TIMER_FIELDS:
+        lines += [f'# HELP {METRIC_PREFIX}_{field} {description}',
+                  f'# TYPE {METRIC_PREFIX}_{field} counter']
+        for (view, action, name), values in sorted(timers.items()):
+            lines.append('{}_{}{{{}}} {}'.format(
+                METRIC_PREFIX, field,
+                format_labels(view=view, action=action, timer=name),
+                values[field]))
+    for event, value in events.items():
+        field = f'recipe_cache_{event}_total'
+        lines += [f'# TYPE {METRIC_PREFIX}_{field} counter',
+                  f'{METRIC_PREFIX}_{field} {value}']
+    return '\n'.join(lines) + '\n'
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        return JSONRenderer().render(data)
+
+
+@api_view(('GET',))
+@permission_classes((IsAdminUser,))
+@renderer_classes((PrometheusRenderer,))
+def metrics(request):
+    """Метрики текущего процесса для Prometheus, только для персонала."""
+    return Response(
+        render_metrics(), content_type='text/plain; version=0.0.4')
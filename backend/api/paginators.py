@@ -1,8 +1,51 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
-from .constants import LIMIT_PAGE_SIZE
+from .constants import (CURSOR_PAGINATION_MODE, LIMIT_PAGE_SIZE,
+                        PAGINATION_MODE_PARAM)
 
 
 class LimitPageNumberPaginator(PageNumberPagination):
     page_size_query_param = 'limit'
     page_size = LIMIT_PAGE_SIZE
+
+
+class LimitCursorPaginator(CursorPagination):
+    """Keyset-пагинация: глубокие страницы стоят столько же, сколько первая."""
+
+    page_size_query_param = 'limit'
+    page_size = LIMIT_PAGE_SIZE
+    ordering = ('-pub_date', 'id')
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
+
+
+class LimitPaginator(LimitPageNumberPaginator):
+    """Постраничная пагинация с курсорным режимом по ?paginate=cursor.
+
+    Порядок курсора берётся из атрибута cursor_ordering представления.
+    """
+
+    cursor_paginator = None
+
+    def is_cursor_mode(self, request):
+        return (
+            request.query_params.get(PAGINATION_MODE_PARAM)
+            == CURSOR_PAGINATION_MODE
+            or LimitCursorPaginator.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_cursor_mode(request):
+            self.cursor_paginator = None
+            return super().paginate_queryset(queryset, request, view)
+        self.cursor_paginator = LimitCursorPaginator(
+            getattr(view, 'cursor_ordering', None))
+        return self.cursor_paginator.paginate_queryset(
+            queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
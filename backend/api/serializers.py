@@ -1,20 +1,30 @@
-import base64
+import json
 import re
 
-from django.core.files.base import ContentFile
-from django.db.models import Count, F
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.db.models import prefetch_related_objects
 from django.shortcuts import get_object_or_404
 from djoser.serializers import UserCreateSerializer
 from djoser.serializers import UserSerializer as DjangoUserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
+from rest_framework.utils import html
 from rest_framework.validators import UniqueTogetherValidator
 
+from recipes import cart, feed
+from recipes.counters import change_counter
+from recipes.images import generate_derivatives, get_paths
 from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
                             ShoppingList, Subscription, Tag)
+from recipes.tasks import run_in_background
 from users.models import User
 
-from .constants import USERNAME_REGEX
+from .cache import invalidate_recipes
+from .constants import BULK_IDS_MAX, USERNAME_REGEX
+from .fields import Base64ImageField
+from .fragments import VIEWER_FIELDS, get_fragments, get_recipe_prefetches
+from .metrics import timed
+from .utils import get_subscription_lookup, lock_user
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -45,14 +55,51 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
+class IngredientInRecipeSerializer(serializers.ModelSerializer):
+    """Ингредиент с количеством -- используется при чтении рецепта."""
+
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit')
+
+    class Meta:
+        model = IngredientRecipe
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
+class ImageDerivativesField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии картинки: {ширина: {формат: url}}."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'image_derivatives')
+        super().__init__(**kwargs)
+
+    def to_representation(self, derivatives):
+        request = self.context.get('request')
+
+        def get_url(path):
+            url = default_storage.url(path)
+            return request.build_absolute_uri(url) if request else url
+
+        return {
+            width: {
+                image_format: get_url(path)
+                for image_format, path in formats.items()
+            }
+            for width, formats in derivatives.items()
+        }
+
+
 class ShortRecipeSerializer(serializers.ModelSerializer):
     """Сериалайзер представления ответа укороченных данных о Рецепте."""
 
     image = Base64ImageField(required=True, allow_null=False)
+    thumbnails = ImageDerivativesField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'thumbnails', 'cooking_time')
 
 
 class RecipeShowIngredientSerializer(serializers.ModelSerializer):
@@ -80,7 +127,30 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class AuthorSerializer(serializers.ModelSerializer):
+class SubscriptionListSerializer(serializers.ListSerializer):
+    """Список, заранее загружающий подписки на авторов всей страницы."""
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.Manager) else data)
+        if request := self.context.get('request'):
+            author_field = getattr(
+                self.child, 'subscription_author_field', 'pk')
+            get_subscription_lookup(request).preload(
+                getattr(item, author_field) for item in items)
+        return super().to_representation(items)
+
+
+class IsSubscribedMixin:
+    """Поле is_subscribed из общего на запрос кэша подписок."""
+
+    def get_is_subscribed(self, obj):
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            return get_subscription_lookup(request).is_subscribed(obj.pk)
+        return False
+
+
+class AuthorSerializer(IsSubscribedMixin, serializers.ModelSerializer):
     """Сериализатор для кастомной модели User."""
 
     is_subscribed = serializers.SerializerMethodField(
@@ -100,12 +170,6 @@ class AuthorSerializer(serializers.ModelSerializer):
             'is_subscribed',
         )
 
-    def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return request.user.follower.filter(author=obj).exists()
-        return False
-
     def get_avatar(self, data):
         request = self.context.get('request')
         if data.avatar:
@@ -113,22 +177,73 @@ class AuthorSerializer(serializers.ModelSerializer):
         return None
 
 
+class RecipeListSerializer(SubscriptionListSerializer):
+    """Список рецептов из кэша фрагментов с флагами текущего пользователя.
+
+    Рецепты сериализуются только при промахе кэша, для попаданий
+    подставляются is_favorited, is_in_shopping_cart и is_subscribed.
+    """
+
+    def to_representation(self, data):
+        request = self.context.get('request')
+        if request is None:
+            return super().to_representation(data)
+        items = list(data.all() if isinstance(data, models.Manager) else data)
+        get_subscription_lookup(request).preload(
+            item.author_id for item in items)
+        fragments = get_fragments(
+            request, items, self.child.get_public_representation)
+        return [
+            self.child.add_viewer_fields(fragment, item)
+            for fragment, item in zip(fragments, items)
+        ]
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для модели Recipe."""
 
     author = AuthorSerializer()
     tags = TagSerializer(many=True,)
-    ingredients = serializers.SerializerMethodField()
+    ingredients = IngredientInRecipeSerializer(
+        source='recipe_ingredients', many=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    thumbnails = ImageDerivativesField()
+
+    subscription_author_field = 'author_id'
 
     class Meta:
         model = Recipe
-        fields = ('id', 'author', 'name', 'image', 'text', 'ingredients',
-                  'tags', 'cooking_time', 'is_favorited',
-                  'is_in_shopping_cart')
+        fields = ('id', 'author', 'name', 'image', 'thumbnails', 'text',
+                  'ingredients', 'tags', 'cooking_time', 'is_favorited',
+                  'is_in_shopping_cart', 'favorites_count')
+        list_serializer_class = RecipeListSerializer
 
-    def get_is_recipe(self, obj, model):
+    @timed('recipe_serializer')
+    def to_representation(self, instance):
+        return super().to_representation(instance)
+
+    def get_public_representation(self, instance):
+        """Ответ без данных пользователя -- фрагмент для кэша."""
+        data = self.to_representation(instance)
+        data.update(dict.fromkeys(VIEWER_FIELDS, False))
+        data['author']['is_subscribed'] = False
+        return data
+
+    def add_viewer_fields(self, fragment, instance):
+        data = {**fragment, 'author': {
+            **fragment['author'],
+            'is_subscribed': self.fields['author'].get_is_subscribed(
+                instance.author),
+        }}
+        data['is_favorited'] = self.get_is_favorited(instance)
+        data['is_in_shopping_cart'] = self.get_is_in_shopping_cart(instance)
+        return data
+
+    def get_is_recipe(self, obj, model, annotation):
+        """Флаг берётся из аннотации queryset, иначе -- запросом в БД."""
+        if (value := getattr(obj, annotation, None)) is not None:
+            return value
         if request := self.context.get('request'):
             user = request.user
             if user.is_anonymous:
@@ -138,15 +253,10 @@ class RecipeSerializer(serializers.ModelSerializer):
         return False
 
     def get_is_favorited(self, obj):
-        return self.get_is_recipe(obj, Favorite)
+        return self.get_is_recipe(obj, Favorite, 'is_favorited')
 
     def get_is_in_shopping_cart(self, obj):
-        return self.get_is_recipe(obj, ShoppingList)
-
-    def get_ingredients(self, obj):
-        return obj.ingredients.values('id', 'name', 'measurement_unit',
-                                      amount=F('ingredientrecipe__amount')
-                                      )
+        return self.get_is_recipe(obj, ShoppingList, 'is_in_shopping_cart')
 
 
 class ShoppingListSerializer(serializers.ModelSerializer):
@@ -196,21 +306,38 @@ class AddEditRecipeSerializer(serializers.ModelSerializer):
         fields = ('name', 'image', 'text', 'ingredients',
                   'tags', 'cooking_time', 'author')
 
+    def to_internal_value(self, data):
+        if html.is_html_input(data):
+            data = self.parse_multipart(data)
+        return super().to_internal_value(data)
+
+    def parse_multipart(self, data):
+        """Теги -- повторяющимся полем, ингредиенты -- JSON-строкой."""
+        parsed = data.dict()
+        if 'tags' in data:
+            parsed['tags'] = data.getlist('tags')
+        if isinstance(parsed.get('ingredients'), str):
+            try:
+                parsed['ingredients'] = json.loads(parsed['ingredients'])
+            except ValueError:
+                raise serializers.ValidationError(
+                    {'ingredients': ['Ожидается JSON-список ингредиентов.']})
+        return parsed
+
     def validate(self, data):
-        if 'tags' not in data:
+        if 'tags' not in data and not self.partial:
             raise serializers.ValidationError(
                 'Заполни теги!')
-        if 'ingredients' not in data:
+        if 'ingredients' not in data and not self.partial:
             raise serializers.ValidationError(
                 'Укажи ингредиенты!')
-        tags = data.get('tags')
-        tags_list = [tag.id for tag in tags]
+        tags_list = [tag.id for tag in data.get('tags', ())]
         if len(tags_list) != len(set(tags_list)):
             raise serializers.ValidationError(
                 'Рецепт содержит повторяющиеся теги!'
             )
-        ingredients = data.get('ingredients')
-        ingredients_list = [item.get('ingredient').id for item in ingredients]
+        ingredients_list = [
+            item.get('ingredient').id for item in data.get('ingredients', ())]
         if len(ingredients_list) != len(set(ingredients_list)):
             raise serializers.ValidationError(
                 'Рецепт содержит повторяющиеся ингредиенты!'
@@ -224,12 +351,17 @@ class AddEditRecipeSerializer(serializers.ModelSerializer):
             )
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
         self.create_tags(tags, recipe)
         self.create_ingredients(ingredients, recipe)
+        change_counter(User, recipe.author_id, 'recipes_count')
+        feed.publish(recipe)
+        run_in_background(generate_derivatives, recipe.pk)
+        invalidate_recipes(recipe.pk)
         return recipe
 
     def create_tags(self, tags, recipe):
@@ -244,17 +376,81 @@ class AddEditRecipeSerializer(serializers.ModelSerializer):
             ) for ingredient in ingredients
         ])
 
+    def update_tags(self, tags, recipe):
+        current = set(recipe.tags.values_list('pk', flat=True))
+        new = {tag.pk for tag in tags}
+        if current - new:
+            recipe.tags.remove(*(current - new))
+        if new - current:
+            recipe.tags.add(*(new - current))
+
+    def update_ingredients(self, ingredients, recipe):
+        """Удаляет, меняет и добавляет только отличающиеся строки.
+
+        Текущий состав читается заново под блокировкой рецепта, а не из
+        prefetch get_object(): тот мог устареть из-за параллельной правки.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in IngredientRecipe.objects.filter(recipe=recipe)
+        }
+        new = {item['ingredient'].id: item['amount'] for item in ingredients}
+        cart.apply_deltas(recipe.pk, {
+            ingredient_id: (
+                new.get(ingredient_id, 0)
+                - getattr(current.get(ingredient_id), 'amount', 0))
+            for ingredient_id in current.keys() | new.keys()
+        })
+        removed = current.keys() - new.keys()
+        if removed:
+            IngredientRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed).delete()
+        changed = []
+        for ingredient_id in current.keys() & new.keys():
+            item = current[ingredient_id]
+            if item.amount != new[ingredient_id]:
+                item.amount = new[ingredient_id]
+                changed.append(item)
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ('amount',))
+        added = new.keys() - current.keys()
+        if added:
+            IngredientRecipe.objects.bulk_create([
+                IngredientRecipe(
+                    recipe=recipe,
+                    ingredient_id=ingredient_id,
+                    amount=new[ingredient_id]
+                ) for ingredient_id in added
+            ])
+        # Ответ строится по новому составу.
+        getattr(recipe, '_prefetched_objects_cache', {}).pop(
+            'recipe_ingredients', None)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         recipe = instance
-        recipe.tags.clear()
-        recipe.ingredients.clear()
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        self.create_tags(tags, recipe)
-        self.create_ingredients(ingredients, recipe)
+        # Состав читается и меняется под блокировкой рецепта, иначе
+        # параллельные правки и добавления в списки покупок
+        # разошлись бы в итогах.
+        cart.lock_recipes((recipe.pk,))
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        if tags is not None:
+            self.update_tags(tags, recipe)
+        if ingredients is not None:
+            self.update_ingredients(ingredients, recipe)
+        invalidate_recipes(recipe.pk)
+        if 'image' in validated_data:
+            run_in_background(generate_derivatives, recipe.pk,
+                              get_paths(recipe.image_derivatives))
+            # save() не пишет производные поля, старые копии сбрасываются
+            # отдельным UPDATE.
+            Recipe.objects.filter(pk=recipe.pk).update(image_derivatives={})
+            validated_data['image_derivatives'] = {}
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
+        prefetch_related_objects((instance,), *get_recipe_prefetches())
         return RecipeSerializer(instance).data
 
 
@@ -277,21 +473,6 @@ class SignupSerializer(UserCreateSerializer):
         return data
 
 
-class Base64ImageField(serializers.ImageField):
-    """Сериализатор для преобразования аватарки."""
-
-    def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            format_, imgstr = data.split(';base64,')
-            ext = format_.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-        return super().to_internal_value(data)
-
-    class Meta:
-        model = User
-        fields = ('avatar',)
-
-
 class SubscriptionSerializer(serializers.Serializer):
     """Для валидации и создания подписки."""
 
@@ -323,22 +504,46 @@ class SubscriptionSerializer(serializers.Serializer):
 
     def create(self, validated_data):
         limit_param = self.context.get('limit_param')
-        queryset = User.objects.annotate(recipes_count=Count('recipes'))
-        user = get_object_or_404(queryset, pk=validated_data.get('pk'))
-        Subscription.objects.create(
-            user=self.context['request'].user,
-            author=user)
+        user = get_object_or_404(User, pk=validated_data.get('pk'))
+        with transaction.atomic():
+            lock_user(self.context['request'].user)
+            Subscription.objects.create(
+                user=self.context['request'].user,
+                author=user)
+            change_counter(User, user.pk, 'followers_count')
+            feed.subscribe(self.context['request'].user.pk, user)
         return UserSubscriptionsSerializer(
             user,
-            context={'limit_param': limit_param})
+            context={
+                'request': self.context['request'],
+                'limit_param': limit_param})
+
 
+class RecipesLimitSerializer(serializers.Serializer):
+    """Проверка параметра recipes_limit."""
 
-class UserSubscriptionsSerializer(serializers.ModelSerializer):
+    recipes_limit = serializers.IntegerField(min_value=1, required=False)
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    """Список id для массовых операций."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_IDS_MAX,
+    )
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
+
+
+class UserSubscriptionsSerializer(IsSubscribedMixin,
+                                  serializers.ModelSerializer):
     """Сериализатор для модели Subscriptions."""
 
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField()
 
     class Meta:
         model = User
@@ -353,23 +558,17 @@ class UserSubscriptionsSerializer(serializers.ModelSerializer):
             'recipes_count',
             'avatar'
         )
-
-    def get_is_subscribed(self, obj):
-        if request := self.context.get('request'):
-            if request.user.is_anonymous:
-                return False
-            return request.user.follower.filter(author=obj).exists()
-        return False
+        list_serializer_class = SubscriptionListSerializer
 
     def get_recipes(self, obj):
         recipes = obj.recipes.all()
         if limit_param := self.context.get('limit_param'):
-            recipes = recipes[:int(limit_param)]
+            recipes = recipes[:limit_param]
         serializer = ShortRecipeSerializer(recipes, many=True, read_only=True)
         return serializer.data
 
 
-class UserSerializer(DjangoUserSerializer):
+class UserSerializer(IsSubscribedMixin, DjangoUserSerializer):
     """Сериализатор для кастомной модели User."""
 
     is_subscribed = serializers.SerializerMethodField(
@@ -386,8 +585,12 @@ class UserSerializer(DjangoUserSerializer):
             'first_name',
             'last_name',
             'avatar',
-            'is_subscribed'
+            'is_subscribed',
+            'recipes_count',
+            'followers_count'
         )
+        read_only_fields = ('recipes_count', 'followers_count')
+        list_serializer_class = SubscriptionListSerializer
 
     def validate(self, data):
         request = self.context.get('request')
@@ -404,12 +607,6 @@ class UserSerializer(DjangoUserSerializer):
             return request.build_absolute_uri(data.avatar.url)
         return None
 
-    def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return request.user.follower.filter(author=obj).exists()
-        return False
-
 
 class FavoriteSerializer(serializers.ModelSerializer):
     """Сериализатор для добавления рецепта в избранное."""
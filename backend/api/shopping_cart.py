@@ -0,0 +1,106 @@
+import csv
+import tempfile
+from functools import lru_cache
+from itertools import chain
+
+from django.conf import settings
+from django.db.models import F
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from recipes.models import ShoppingCartItem
+
+TITLE = 'Список покупок:'
+CSV_HEADER = ('Ингредиент', 'Количество', 'Единица измерения')
+PDF_FONT_NAME = 'ShoppingCartFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+PDF_LINE_HEIGHT = 18
+
+
+class ShoppingCartRenderer(BaseRenderer):
+    """Формат файла списка покупок. Ошибки отдаются как JSON."""
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return JSONRenderer().render(data)
+
+
+class TextShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PDFShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+def get_shopping_cart(user):
+    """Готовые итоги списка покупок, одним чтением по индексу."""
+    return ShoppingCartItem.objects.filter(user=user).values(
+        name=F('ingredient__name'),
+        unit=F('ingredient__measurement_unit'),
+        total=F('amount'),
+    ).order_by('name', 'unit').iterator()
+
+
+def iter_txt(rows):
+    yield f'{TITLE}\n\n'
+    for row in rows:
+        yield f"{row['name']} - {row['total']} {row['unit']}\n"
+
+
+class Echo:
+    """Псевдофайл: csv.writer возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in rows:
+        yield writer.writerow((row['name'], row['total'], row['unit']))
+
+
+@lru_cache(maxsize=None)
+def register_pdf_font():
+    pdfmetrics.registerFont(
+        TTFont(PDF_FONT_NAME, settings.SHOPPING_CART_PDF_FONT))
+
+
+def build_pdf(rows):
+    """PDF собирается во временном файле, который затем отдаётся потоком.
+
+    Формат PDF требует таблицы ссылок в конце документа, поэтому
+    генерировать его по строкам нельзя.
+    """
+    register_pdf_font()
+    file = tempfile.TemporaryFile()
+    pdf = canvas.Canvas(file, pagesize=A4)
+    width, height = A4
+    y = height - PDF_MARGIN
+    lines = (
+        f"{row['name']} - {row['total']} {row['unit']}" for row in rows)
+    for line in chain((TITLE, ''), lines):
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            y = height - PDF_MARGIN
+        pdf.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+        pdf.drawString(PDF_MARGIN, y, line)
+        y -= PDF_LINE_HEIGHT
+    pdf.save()
+    file.seek(0)
+    return file
@@ -0,0 +1,58 @@
+import threading
+import time
+from collections import OrderedDict
+
+import short_url
+from django.conf import settings
+
+from recipes.models import Recipe
+
+MAX_RECIPE_ID = 2 ** 63 - 1
+
+
+class RecipeIdCache:
+    """LRU существующих id рецептов в памяти процесса.
+
+    Запоминаются только найденные рецепты, id не переиспользуются.
+    Удаление рецепта сразу убирает его из кэша процесса, где сработал
+    сигнал; в остальных процессах запись живёт не дольше timeout.
+    """
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.ids = OrderedDict()
+
+    def exists(self, pk):
+        with self.lock:
+            if self.ids.get(pk, 0) > time.monotonic():
+                self.ids.move_to_end(pk)
+                return True
+        if not Recipe.objects.filter(pk=pk).exists():
+            return False
+        with self.lock:
+            self.ids[pk] = time.monotonic() + self.timeout
+            self.ids.move_to_end(pk)
+            if len(self.ids) > self.maxsize:
+                self.ids.popitem(last=False)
+        return True
+
+    def discard(self, pk):
+        with self.lock:
+            self.ids.pop(pk, None)
+
+
+recipe_ids = RecipeIdCache(
+    settings.SHORT_LINK_CACHE_SIZE, settings.SHORT_LINK_CACHE_TIMEOUT)
+
+
+def resolve_short_link(code):
+    """id существующего рецепта по короткому коду или None."""
+    try:
+        pk = short_url.decode_url(code)
+    except (ValueError, KeyError):
+        return None
+    if not 0 < pk <= MAX_RECIPE_ID:
+        return None
+    return pk if recipe_ids.exists(pk) else None
@@ -0,0 +1,93 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Favorite, Ingredient, IngredientRecipe, Recipe, Tag
+
+from .authentication import invalidate_tokens
+from .cache import (TAGS_VERSION_KEY, bump_versions, invalidate_author,
+                    invalidate_catalog, invalidate_recipes)
+from .ingredient_index import invalidate_ingredient_index
+from .metrics import install_query_recorder
+from .short_links import recipe_ids
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    invalidate_recipes(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    recipe_ids.discard(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def recipe_relation_changed(sender, instance, **kwargs):
+    invalidate_recipes(instance.recipe_id)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+def favorite_changed(sender, instance, **kwargs):
+    """favorites_count в кэше списков для анонимов может отставать
+    на RECIPE_CACHE_TIMEOUT, иначе каждый клик сбрасывал бы все списки.
+    """
+    invalidate_recipes(instance.recipe_id, lists=False)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_recipes(instance.pk)
+    elif pk_set:
+        invalidate_recipes(*pk_set)
+    else:
+        invalidate_catalog()
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def catalog_changed(sender, **kwargs):
+    invalidate_catalog()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    transaction.on_commit(invalidate_ingredient_index)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(sender, **kwargs):
+    transaction.on_commit(lambda: bump_versions(TAGS_VERSION_KEY))
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    """Данные автора входят в ответ рецепта, вход в систему -- нет."""
+    if created or (update_fields and set(update_fields) == {'last_login'}):
+        return
+    invalidate_author(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate_tokens(instance.key)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields, **kwargs):
+    """Пароль, активность и профиль в кэше токенов должны быть свежими."""
+    if created or (update_fields and set(update_fields) == {'last_login'}):
+        return
+    invalidate_tokens(
+        *Token.objects.filter(user=instance).values_list('key', flat=True))
+
+
+connection_created.connect(install_query_recorder)
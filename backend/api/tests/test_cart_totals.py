@@ -0,0 +1,106 @@
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from rest_framework.test import APITestCase
+
+from recipes import cart
+from recipes.models import (Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCartItem, ShoppingList, Tag)
+from users.models import User
+
+
+class CartTotalsTestCase(APITestCase):
+    """Итоги списков покупок сходятся с составом рецептов после правок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='a', last_name='a', password='password-123')
+        cls.buyer = User.objects.create_user(
+            email='buyer@example.com', username='buyer',
+            first_name='b', last_name='b', password='password-123')
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.salt, cls.sugar, cls.flour = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'сахар', 'мука'))
+
+    def setUp(self):
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Блины', text='...', cooking_time=10,
+            image='recipes/images/test.png')
+        self.recipe.tags.add(self.tag)
+        IngredientRecipe.objects.bulk_create([
+            IngredientRecipe(recipe=self.recipe, ingredient=self.salt,
+                             amount=10),
+            IngredientRecipe(recipe=self.recipe, ingredient=self.sugar,
+                             amount=4),
+        ])
+        ShoppingList.objects.create(user=self.buyer, recipe=self.recipe)
+        cart.add_recipes(self.buyer.pk, (self.recipe.pk,))
+        self.client.force_authenticate(self.author)
+
+    def assertCartTotalsConsistent(self):
+        self.assertEqual(
+            sorted(cart.expected_totals()),
+            sorted(ShoppingCartItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount')),
+        )
+
+    def patch_ingredients(self, *amounts):
+        return self.client.patch(
+            f'/api/recipes/{self.recipe.pk}/',
+            {'ingredients': [
+                {'id': ingredient.pk, 'amount': amount}
+                for ingredient, amount in amounts
+            ]},
+            format='json',
+        )
+
+    def test_edit_by_diff(self):
+        """Изменение, удаление и добавление ингредиентов одной правкой."""
+        response = self.patch_ingredients((self.salt, 7), (self.flour, 2))
+        self.assertEqual(response.status_code, 200)
+        self.assertCartTotalsConsistent()
+        self.assertEqual(
+            dict(ShoppingCartItem.objects.filter(
+                user=self.buyer).values_list('ingredient_id', 'amount')),
+            {self.salt.pk: 7, self.flour.pk: 2},
+        )
+
+    def test_edit_without_ingredients(self):
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.pk}/', {'name': 'Оладьи'},
+            format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertCartTotalsConsistent()
+
+    def test_check_command_fails_on_mismatch(self):
+        call_command('repair_cart_totals', '--check', stdout=mock.Mock())
+        ShoppingCartItem.objects.filter(user=self.buyer).update(amount=1)
+        with self.assertRaises(CommandError):
+            call_command('repair_cart_totals', '--check', stdout=mock.Mock())
+
+    def test_edit_after_concurrent_edit(self):
+        """Правка, начатая до чужой правки, считает разность от состава,
+        прочитанного под блокировкой, а не от prefetch get_object().
+        """
+        lock_recipes = cart.lock_recipes
+
+        def concurrent_edit_then_lock(recipe_ids):
+            IngredientRecipe.objects.filter(
+                recipe=self.recipe, ingredient=self.salt).update(amount=5)
+            cart.apply_deltas(self.recipe.pk, {self.salt.pk: -5})
+            lock_recipes(recipe_ids)
+
+        with mock.patch.object(cart, 'lock_recipes',
+                               side_effect=concurrent_edit_then_lock):
+            response = self.patch_ingredients((self.salt, 3))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item['id'], item['amount'])
+             for item in response.data['ingredients']],
+            [(self.salt.pk, 3)],
+        )
+        self.assertCartTotalsConsistent()
@@ -0,0 +1,36 @@
+from rest_framework.test import APITestCase
+
+from recipes.models import Favorite, Recipe
+from users.models import User
+
+
+class CountersTestCase(APITestCase):
+    """Счётчики не уходят ниже нуля для строк, созданных не через API."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='a', last_name='a', password='password-123')
+        self.reader = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='r', last_name='r', password='password-123')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Блины', text='...', cooking_time=10,
+            image='recipes/images/test.png')
+
+    def test_unfavorite_row_created_outside_api(self):
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        self.client.force_authenticate(self.reader)
+        response = self.client.delete(
+            f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.assertEqual(response.status_code, 204)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+    def test_delete_recipe_created_outside_api(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.delete(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Recipe.objects.filter(pk=self.recipe.pk).exists())
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
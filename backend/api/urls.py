@@ -1,6 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from .async_views import async_read_routes
+from .metrics import metrics
 from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
 
 router = DefaultRouter()
@@ -9,8 +11,16 @@ router.register('recipes', RecipeViewSet, basename='recipe')
 router.register('tags', TagViewSet, basename='tag')
 router.register('ingredients', IngredientViewSet, basename='ingredient')
 
+# Маршруты, которые под ASGI обслуживаются асинхронно.
+ASYNC_ROUTES = {
+    'recipe-list', 'recipe-detail',
+    'tag-list', 'tag-detail',
+    'ingredient-list', 'ingredient-detail',
+}
+
 urlpatterns = [
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
-    path('', include(router.urls)),
+    path('metrics/', metrics, name='metrics'),
+    path('', include(async_read_routes(router.urls, ASYNC_ROUTES))),
 ]
@@ -9,3 +9,99 @@ def generate_confirmation_code(user):
 def validate_confirmation_code(user, code):
     """Проверка кода подтверждения на соответствие сгенерированному токену."""
     return default_token_generator.check_token(user, code)
+
+
+class SubscriptionLookup:
+    """Подписки текущего пользователя, загружаемые пачкой на запрос."""
+
+    def __init__(self, user):
+        self.user = user
+        self.loaded_ids = set()
+        self.subscribed_ids = set()
+
+    def preload(self, author_ids):
+        """Одним запросом проверяет подписку на всех переданных авторов."""
+        if self.user.is_anonymous:
+            return
+        missing_ids = set(author_ids) - self.loaded_ids
+        if not missing_ids:
+            return
+        self.subscribed_ids.update(
+            self.user.follower.filter(
+                author__in=missing_ids).values_list('author_id', flat=True)
+        )
+        self.loaded_ids |= missing_ids
+
+    def is_subscribed(self, author_id):
+        self.preload((author_id,))
+        return author_id in self.subscribed_ids
+
+
+def get_subscription_lookup(request):
+    """Возвращает общий для всех сериализаторов запроса кэш подписок."""
+    lookup = getattr(request, '_subscription_lookup', None)
+    if lookup is None:
+        lookup = SubscriptionLookup(request.user)
+        request._subscription_lookup = lookup
+    return lookup
+
+
+BULK_CREATED = 'created'
+BULK_EXISTS = 'exists'
+BULK_DELETED = 'deleted'
+BULK_NOT_FOUND = 'not_found'
+BULK_INVALID = 'invalid'
+
+
+def get_bulk_results(ids, statuses):
+    """Результаты по каждому id в порядке запроса."""
+    return {'results': [{'id': pk, 'status': statuses[pk]} for pk in ids]}
+
+
+def lock_user(user):
+    """Блокирует строку пользователя до конца транзакции.
+
+    Изменения избранного, списка покупок и подписок одного пользователя
+    идут по очереди: повторный запрос видит строки, вставленные
+    или удалённые первым, и не меняет счётчики второй раз.
+    """
+    list(type(user).objects.select_for_update().filter(
+        pk=user.pk).values_list('pk', flat=True))
+
+
+def bulk_add(model, user, field, targets, ids):
+    """Создаёт связи user -> ids, которых ещё нет, двумя запросами
+    на чтение и одной вставкой.
+
+    targets -- queryset допустимых объектов, field -- поле связи
+    (например, 'recipe_id'). Возвращает созданные id и статусы.
+    Вызывается в транзакции.
+    """
+    lock_user(user)
+    found = set(targets.filter(pk__in=ids).values_list('pk', flat=True))
+    existing = set(model.objects.filter(
+        user=user, **{f'{field}__in': found}
+    ).values_list(field, flat=True))
+    created = [pk for pk in ids if pk in found and pk not in existing]
+    model.objects.bulk_create(
+        [model(user=user, **{field: pk}) for pk in created],
+        ignore_conflicts=True,
+    )
+    statuses = dict.fromkeys(ids, BULK_NOT_FOUND)
+    statuses.update(dict.fromkeys(existing, BULK_EXISTS))
+    statuses.update(dict.fromkeys(created, BULK_CREATED))
+    return created, statuses
+
+
+def bulk_remove(model, user, field, ids):
+    """Удаляет связи user -> ids. Возвращает удалённые id и статусы.
+
+    Вызывается в транзакции.
+    """
+    lock_user(user)
+    relations = model.objects.filter(user=user, **{f'{field}__in': ids})
+    deleted = set(relations.values_list(field, flat=True))
+    relations.delete()
+    statuses = dict.fromkeys(ids, BULK_NOT_FOUND)
+    statuses.update(dict.fromkeys(deleted, BULK_DELETED))
+    return [pk for pk in ids if pk in deleted], statuses
@@ -1,33 +1,74 @@
 import short_url
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Count
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import (Exists, F, OuterRef, Prefetch, Value, Window,
+                              prefetch_related_objects)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.utils.cache import patch_cache_control
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser import views as djoser_views
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.status import (HTTP_200_OK, HTTP_201_CREATED,
                                    HTTP_204_NO_CONTENT)
 
+from api.cache import (INGREDIENTS_VERSION_KEY, TAGS_VERSION_KEY,
+                       cache_anonymous_response, conditional_catalog,
+                       invalidate_recipes)
 from api.filters import IngredientFilter, RecipeFilter
-from api.paginators import LimitPageNumberPaginator
+from api.fragments import get_recipe_prefetches
+from api.ingredient_index import ingredient_index
+from api.metrics import timed
+from api.paginators import LimitCursorPaginator, LimitPaginator
+from api.parsers import LimitedJSONParser
 from api.permissions import IsAuthorOrAdminOrReadOnly
-from api.serializers import (AddEditRecipeSerializer, FavoriteSerializer,
-                             IngredientSerializer, RecipeSerializer,
-                             RecipeShowIngredientSerializer,
-                             ShortRecipeSerializer, SubscriptionSerializer,
-                             TagSerializer, UserSerializer,
-                             UserSubscriptionsSerializer)
-from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingList, Subscription, Tag)
+from api.serializers import (AddEditRecipeSerializer, BulkIdsSerializer,
+                             FavoriteSerializer, IngredientSerializer,
+                             RecipeSerializer, RecipeShowIngredientSerializer,
+                             RecipesLimitSerializer, ShortRecipeSerializer,
+                             SubscriptionSerializer, TagSerializer,
+                             UserSerializer, UserSubscriptionsSerializer)
+from api.shopping_cart import (CSVShoppingCartRenderer,
+                               PDFShoppingCartRenderer,
+                               TextShoppingCartRenderer, build_pdf,
+                               get_shopping_cart, iter_csv, iter_txt)
+from api.short_links import resolve_short_link
+from api.utils import (BULK_INVALID, bulk_add, bulk_remove, get_bulk_results,
+                       lock_user)
+from recipes import cart, feed
+from recipes.counters import change_counter, change_counters
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingList,
+                            Subscription, Tag)
+from recipes.search import search_ingredients
 
 User = get_user_model()
 
 
+def short_link_redirect(request, code):
+    """Переход по короткой ссылке на страницу рецепта."""
+    pk = resolve_short_link(code)
+    if pk is None:
+        raise Http404('Рецепт не найден.')
+    response = redirect(f'/recipes/{pk}')
+    patch_cache_control(
+        response, public=True, max_age=settings.SHORT_LINK_MAX_AGE)
+    return response
+
+
+def get_bulk_ids(request):
+    """Проверенный список id из тела массового запроса."""
+    serializer = BulkIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data['ids']
+
+
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet для модели Ingredient."""
 
@@ -37,7 +78,27 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (AllowAny, )
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
-    search_fields = ['name']
+
+    @conditional_catalog(INGREDIENTS_VERSION_KEY)
+    def list(self, request, *args, **kwargs):
+        """Поиск по началу названия обслуживается индексом в памяти.
+
+        Если совпадений по началу слов меньше лимита, список дополняется
+        вхождениями подстроки и похожими названиями из базы.
+        """
+        if name := request.query_params.get('name'):
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+            found = ingredient_index.search(name, limit)
+            if len(found) < limit:
+                found += search_ingredients(
+                    name, limit - len(found),
+                    exclude=[item['id'] for item in found])
+            return Response(found)
+        return super().list(request, *args, **kwargs)
+
+    @conditional_catalog(INGREDIENTS_VERSION_KEY)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
@@ -48,15 +109,58 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
     permission_classes = (AllowAny,)
 
+    @conditional_catalog(TAGS_VERSION_KEY)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_catalog(TAGS_VERSION_KEY)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """ViewSet для модели Recipe."""
 
-    queryset = Recipe.objects.select_related(
-        'author').prefetch_related('tags', 'ingredients')
     filter_backends = (DjangoFilterBackend, )
-    pagination_class = LimitPageNumberPaginator
+    pagination_class = LimitPaginator
+    feed_ordering = ('-feed_pub_date', 'id')
     filterset_class = RecipeFilter
+    parser_classes = (LimitedJSONParser, MultiPartParser, FormParser)
+
+    def get_queryset(self):
+        queryset = Recipe.objects.select_related('author').defer(
+            'search_vector',
+        )
+        if self.action not in ('list', 'feed'):
+            # Списки догружают теги и ингредиенты только для рецептов,
+            # которых нет в кэше фрагментов.
+            queryset = queryset.prefetch_related(*get_recipe_prefetches())
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+            )
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingList.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+        )
+
+    @cache_anonymous_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_anonymous_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        cart.remove_recipe_everywhere(instance.pk)
+        instance.delete()
+        change_counter(User, instance.author_id, 'recipes_count', -1)
 
     def get_permissions(self):
         if self.action in ('list', 'retrieve', 'get_link'):
@@ -68,6 +172,25 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return AddEditRecipeSerializer
         return RecipeSerializer
 
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated,)
+    )
+    def feed(self, request):
+        """Рецепты авторов из подписок, новые первыми.
+
+        Читается из ленты пользователя по индексу (user, pub_date),
+        поэтому цена не зависит от числа подписок.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            feed_entries__user=request.user,
+        ).annotate(feed_pub_date=F('feed_entries__pub_date'))
+        paginator = LimitCursorPaginator(self.feed_ordering)
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = RecipeSerializer(
+            page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
     @action(
         detail=True,
         permission_classes=(AllowAny,),
@@ -93,15 +216,21 @@ class RecipeViewSet(viewsets.ModelViewSet):
             data={'user': request.user.pk, 'recipe': recipe}
         )
         serializer.is_valid(raise_exception=True)
-        favorite_recipe = serializer.save(pk=pk)
+        with transaction.atomic():
+            lock_user(request.user)
+            favorite_recipe = serializer.save()
+            change_counter(Recipe, recipe, 'favorites_count')
         short_recipe = ShortRecipeSerializer(favorite_recipe.recipe).data
         return Response(data=short_recipe, status=status.HTTP_201_CREATED)
 
     @favorite.mapping.delete
     def delete_from_favorite(self, request, pk):
         """Удалить рецепт из избранного."""
-        deleted_raws, _ = Favorite.objects.filter(user=request.user,
-                                                  recipe=pk).delete()
+        with transaction.atomic():
+            deleted_raws, _ = Favorite.objects.filter(user=request.user,
+                                                      recipe=pk).delete()
+            if deleted_raws:
+                change_counter(Recipe, pk, 'favorites_count', -1)
         if deleted_raws == 0:
             return Response(status=status.HTTP_400_BAD_REQUEST)
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -118,48 +247,111 @@ class RecipeViewSet(viewsets.ModelViewSet):
             data={'user': request.user.pk, 'recipe': recipe}
         )
         serializer.is_valid(raise_exception=True)
-        shopping_list = serializer.save(pk=pk)
+        with transaction.atomic():
+            lock_user(request.user)
+            shopping_list = serializer.save()
+            change_counter(Recipe, recipe, 'in_carts_count')
+            cart.add_recipes(request.user.pk, (recipe,))
         short_recipe = ShortRecipeSerializer(shopping_list.recipe).data
         return Response(data=short_recipe, status=status.HTTP_201_CREATED)
 
     @shopping_cart.mapping.delete
     def delete_from_shopping_cart(self, request, pk):
         """Удаляет рецепт из списка покупок."""
-        deleted_raws, _ = ShoppingList.objects.filter(user=request.user,
-                                                      recipe__id=pk).delete()
+        with transaction.atomic():
+            deleted_raws, _ = ShoppingList.objects.filter(
+                user=request.user, recipe__id=pk).delete()
+            if deleted_raws:
+                change_counter(Recipe, pk, 'in_carts_count', -1)
+                cart.remove_recipes(request.user.pk, (pk,))
         if deleted_raws == 0:
             return Response(status=status.HTTP_400_BAD_REQUEST)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=('post',),
+        url_path='favorite/bulk',
+        url_name='favorite-bulk',
+        permission_classes=(IsAuthenticated,)
+    )
+    def add_bulk_to_favorite(self, request):
+        """Добавить в избранное несколько рецептов."""
+        ids = get_bulk_ids(request)
+        with transaction.atomic():
+            created, statuses = bulk_add(
+                Favorite, request.user, 'recipe_id', Recipe.objects, ids)
+            change_counters(Recipe, created, 'favorites_count')
+            invalidate_recipes(*created, lists=False)
+        return Response(get_bulk_results(ids, statuses), status=HTTP_200_OK)
+
+    @add_bulk_to_favorite.mapping.delete
+    def delete_bulk_from_favorite(self, request):
+        """Удалить из избранного несколько рецептов."""
+        ids = get_bulk_ids(request)
+        with transaction.atomic():
+            deleted, statuses = bulk_remove(
+                Favorite, request.user, 'recipe_id', ids)
+            change_counters(Recipe, deleted, 'favorites_count', -1)
+        return Response(get_bulk_results(ids, statuses), status=HTTP_200_OK)
+
+    @action(
+        detail=False,
+        methods=('post',),
+        url_path='shopping_cart/bulk',
+        url_name='shopping-cart-bulk',
+        permission_classes=(IsAuthenticated,)
+    )
+    def add_bulk_into_shopping_cart(self, request):
+        """Добавляет в список покупок несколько рецептов."""
+        ids = get_bulk_ids(request)
+        with transaction.atomic():
+            created, statuses = bulk_add(
+                ShoppingList, request.user, 'recipe_id', Recipe.objects, ids)
+            change_counters(Recipe, created, 'in_carts_count')
+            cart.add_recipes(request.user.pk, created)
+        return Response(get_bulk_results(ids, statuses), status=HTTP_200_OK)
+
+    @add_bulk_into_shopping_cart.mapping.delete
+    def delete_bulk_from_shopping_cart(self, request):
+        """Удаляет из списка покупок несколько рецептов."""
+        ids = get_bulk_ids(request)
+        with transaction.atomic():
+            deleted, statuses = bulk_remove(
+                ShoppingList, request.user, 'recipe_id', ids)
+            change_counters(Recipe, deleted, 'in_carts_count', -1)
+            cart.remove_recipes(request.user.pk, deleted)
+        return Response(get_bulk_results(ids, statuses), status=HTTP_200_OK)
+
     @action(
         detail=False,
         methods=['GET'],
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        renderer_classes=(TextShoppingCartRenderer, CSVShoppingCartRenderer,
+                          PDFShoppingCartRenderer),
     )
+    @timed('download_shopping_cart')
     def download_shopping_cart(self, request):
-        """Скачивание списка покупок."""
-        user = request.user
-        ingredient_recipes = IngredientRecipe.objects.filter(
-            recipe__shopping_list__user=user).select_related('ingredient')
-        shopping_list = {}
-        for recipe_ingredient in ingredient_recipes:
-            name = recipe_ingredient.ingredient.name
-            amount = recipe_ingredient.amount
-            unit = recipe_ingredient.ingredient.measurement_unit
-            if name in shopping_list:
-                shopping_list[name]['amount'] += amount
-            else:
-                shopping_list[name] = {'amount': amount, 'unit': unit}
-
-        return self.get_shopping_cart_file_response(shopping_list)
-
-    def get_shopping_cart_file_response(self, shopping_list):
-        text = 'Список покупок:\n\n'
-        for name, data in shopping_list.items():
-            text += f"{name} - {data['amount']} {data['unit']}\n"
-        response = HttpResponse(text, content_type='text/plain; charset=UTF-8')
-        response['Content-Disposition'] = 'attachment; filename="shoplist.txt"'
-
+        """Скачивание списка покупок в формате txt, csv или pdf."""
+        shopping_list = get_shopping_cart(request.user)
+        return self.get_shopping_cart_file_response(
+            shopping_list, request.accepted_renderer.format)
+
+    def get_shopping_cart_file_response(self, shopping_list, file_format):
+        filename = f'shoplist.{file_format}'
+        if file_format == 'pdf':
+            return FileResponse(build_pdf(shopping_list), as_attachment=True,
+                                filename=filename,
+                                content_type='application/pdf')
+        if file_format == 'csv':
+            response = StreamingHttpResponse(
+                iter_csv(shopping_list),
+                content_type='text/csv; charset=UTF-8')
+        else:
+            response = StreamingHttpResponse(
+                iter_txt(shopping_list),
+                content_type='text/plain; charset=UTF-8')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
         return response
 
 
@@ -168,7 +360,8 @@ class UserViewSet(djoser_views.UserViewSet):
 
     queryset = User.objects.all()
     serializer_class = UserSerializer
-    pagination_class = LimitPageNumberPaginator
+    pagination_class = LimitPaginator
+    cursor_ordering = ('username',)
 
     @action(
         detail=False,
@@ -176,14 +369,20 @@ class UserViewSet(djoser_views.UserViewSet):
         permission_classes=(IsAuthenticated,)
     )
     def me(self, request):
-        """Показывает профиль текущего аутентифицированного пользователя."""
-        serializer = UserSerializer(request.user)
+        """Показывает профиль текущего аутентифицированного пользователя.
+
+        Пользователь читается заново: request.user может прийти из кэша
+        токенов, а счётчики меняются без сохранения модели.
+        """
+        serializer = UserSerializer(
+            self.get_queryset().get(pk=request.user.pk))
         return Response(serializer.data, status=HTTP_200_OK)
 
     @action(
         detail=False,
         url_path=r'me/avatar',
-        permission_classes=(IsAuthenticated,)
+        permission_classes=(IsAuthenticated,),
+        parser_classes=(LimitedJSONParser, MultiPartParser, FormParser),
     )
     def avatar(self, request):
         """Управление аватаром пользователя."""
@@ -208,20 +407,61 @@ class UserViewSet(djoser_views.UserViewSet):
         request.user.avatar.delete()
         return Response(status=HTTP_204_NO_CONTENT)
 
+    def get_recipes_limit(self):
+        """Проверенный параметр recipes_limit или None."""
+        serializer = RecipesLimitSerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data.get('recipes_limit')
+
+    def get_recipes_prefetch(self, limit, authors):
+        """Последние limit рецептов каждого автора страницы одним запросом.
+
+        ROW_NUMBER() OVER (PARTITION BY author_id ORDER BY pub_date DESC)
+        нумерует рецепты авторов страницы по индексу
+        recipe_author_pub_date, внешний запрос оставляет номера
+        не больше limit. Django 3.2 не фильтрует по оконным функциям,
+        поэтому фильтр -- обёртка RawSQL над скомпилированным запросом.
+        """
+        if limit is None:
+            return 'recipes'
+        ranked = Recipe.objects.filter(author__in=authors).annotate(
+            position=Window(
+                expression=RowNumber(),
+                partition_by=F('author_id'),
+                order_by=F('pub_date').desc(),
+            )
+        ).order_by().values('pk', 'position')
+        sql, params = ranked.query.sql_with_params()
+        latest_recipes = RawSQL(
+            f'SELECT ranked.id FROM ({sql}) ranked '
+            'WHERE ranked.position <= %s',
+            (*params, limit),
+        )
+        return Prefetch(
+            'recipes',
+            queryset=Recipe.objects.filter(pk__in=latest_recipes)
+        )
+
     @action(
         detail=False,
         permission_classes=(IsAuthenticated,)
     )
+    @timed('subscriptions')
     def subscriptions(self, request):
-        """Список подписок."""
-        users = User.objects.filter(
-            followed__user=request.user).annotate(
-                recipes_count=Count('recipes'))
-        limit_param = request.query_params.get('recipes_limit')
-        paginated_queryset = self.paginate_queryset(users)
+        """Список подписок.
+
+        Рецепты догружаются после пагинации -- только для авторов
+        текущей страницы.
+        """
+        limit_param = self.get_recipes_limit()
+        users = User.objects.filter(followed__user=request.user)
+        page = self.paginate_queryset(users)
+        prefetch_related_objects(
+            page, self.get_recipes_prefetch(limit_param, page))
         serializer = UserSubscriptionsSerializer(
-            paginated_queryset,
+            page,
             context={
+                'request': request,
                 'limit_param': limit_param},
             many=True)
         return self.get_paginated_response(serializer.data)
@@ -234,9 +474,10 @@ class UserViewSet(djoser_views.UserViewSet):
         """Action для подписки/отписки на пользователя."""
 
     @subscribe.mapping.post
+    @timed('follow')
     def follow(self, request, id):
         """Подписка."""
-        limit_param = request.query_params.get('recipes_limit')
+        limit_param = self.get_recipes_limit()
         serializer = SubscriptionSerializer(
             data=request.data,
             context={
@@ -249,10 +490,49 @@ class UserViewSet(djoser_views.UserViewSet):
         return Response(subscription.data, status=HTTP_201_CREATED)
 
     @subscribe.mapping.delete
+    @timed('unfollow')
     def unfollow(self, request, id):
         """Отписка."""
-        deleted_raws, _ = Subscription.objects.filter(user=request.user,
-                                                      author=id).delete()
+        with transaction.atomic():
+            deleted_raws, _ = Subscription.objects.filter(
+                user=request.user, author=id).delete()
+            if deleted_raws:
+                change_counter(User, id, 'followers_count', -1)
+                feed.prune(request.user.pk, id)
         if deleted_raws == 0:
             return Response(status=status.HTTP_400_BAD_REQUEST)
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+        detail=False,
+        methods=('post',),
+        url_path='subscribe/bulk',
+        url_name='subscribe-bulk',
+        permission_classes=(IsAuthenticated,)
+    )
+    @timed('follow_bulk')
+    def follow_bulk(self, request):
+        """Подписка на нескольких пользователей."""
+        ids = get_bulk_ids(request)
+        with transaction.atomic():
+            created, statuses = bulk_add(
+                Subscription, request.user, 'author_id',
+                User.objects.exclude(pk=request.user.pk), ids)
+            change_counters(User, created, 'followers_count')
+            feed.subscribe_many(request.user.pk, created)
+        if request.user.pk in statuses:
+            statuses[request.user.pk] = BULK_INVALID
+        return Response(get_bulk_results(ids, statuses), status=HTTP_200_OK)
+
+    @follow_bulk.mapping.delete
+    @timed('unfollow_bulk')
+    def unfollow_bulk(self, request):
+        """Отписка от нескольких пользователей."""
+        ids = get_bulk_ids(request)
+        with transaction.atomic():
+            deleted, statuses = bulk_remove(
+                Subscription, request.user, 'author_id', ids)
+            change_counters(User, deleted, 'followers_count', -1)
+            if deleted:
+                feed.prune(request.user.pk, *deleted)
+        return Response(get_bulk_results(ids, statuses), status=HTTP_200_OK)
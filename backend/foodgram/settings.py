@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from django.core.management.utils import get_random_secret_key
 from dotenv import load_dotenv
 
@@ -35,6 +36,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'rest_framework.authtoken',
@@ -46,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.metrics_middleware',
+    'api.db_routing.replica_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -92,6 +96,26 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения: DB_REPLICA_HOSTS=host1,host2, остальные
+# параметры подключения -- как у основной БД. Клиент, изменивший данные,
+# REPLICA_STICKY_SECONDS читает с основной БД; недоступная реплика
+# исключается на REPLICA_RETRY_SECONDS. Отметка об изменении хранится
+# в кэше, поэтому реплики требуют общего для процессов CACHE_BACKEND
+# (см. SHARED_CACHE ниже).
+REPLICA_DATABASES = []
+for number, host in enumerate(
+        filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['api.db_routing.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+REPLICA_RETRY_SECONDS = int(os.getenv('REPLICA_RETRY_SECONDS', 30))
+
 # DATABASES = {
 #     'default': {
 #         'ENGINE': 'django.db.backends.sqlite3',
@@ -99,6 +123,93 @@ DATABASES = {
 #     }
 # }
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Для файлового кэша: CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# и CACHE_LOCATION=/путь/к/каталогу.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+# Кэш общий для всех процессов (не locmem и не dummy). Без него кэш
+# токенов работает только внутри процесса, а версии кэша ответов
+# живут CACHE_VERSION_LOCAL_TIMEOUT секунд: изменение, сделанное
+# в другом процессе, видно не позже чем через это время.
+SHARED_CACHE = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+if REPLICA_DATABASES and not SHARED_CACHE:
+    raise ImproperlyConfigured(
+        'DB_REPLICA_HOSTS требует общего для всех процессов CACHE_BACKEND: '
+        'иначе следующий запрос клиента, попавший в другой процесс, '
+        'не увидит его изменений на отстающей реплике.'
+    )
+
+CACHE_VERSION_LOCAL_TIMEOUT = int(
+    os.getenv('CACHE_VERSION_LOCAL_TIMEOUT', 10))
+
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 5 * 60))
+# Общая часть ответа по рецепту; сбрасывается сменой версии рецепта.
+RECIPE_FRAGMENT_TIMEOUT = int(os.getenv('RECIPE_FRAGMENT_TIMEOUT', 60 * 60))
+
+# Сколько ингредиентов возвращает поиск по началу названия.
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 20))
+
+# Загрузка картинок: multipart-файлы пишутся во временные файлы на диске,
+# JSON с base64 отклоняется по Content-Length до чтения тела.
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+MAX_IMAGE_UPLOAD_SIZE = int(
+    os.getenv('MAX_IMAGE_UPLOAD_SIZE', 7 * 1024 * 1024))
+MAX_JSON_BODY_SIZE = int(os.getenv('MAX_JSON_BODY_SIZE', 10 * 1024 * 1024))
+
+# Короткие ссылки: сколько id рецептов помнить и сколько секунд, время
+# кэширования редиректа клиентами и прокси. Удалённый рецепт может
+# открываться по ссылке не дольше суммы двух последних значений.
+SHORT_LINK_CACHE_SIZE = int(os.getenv('SHORT_LINK_CACHE_SIZE', 100_000))
+SHORT_LINK_CACHE_TIMEOUT = int(os.getenv('SHORT_LINK_CACHE_TIMEOUT', 60))
+SHORT_LINK_MAX_AGE = int(os.getenv('SHORT_LINK_MAX_AGE', 5 * 60))
+
+# Кэш токенов: записей в процессе, время жизни в процессе и в общем кэше
+# (общий слой используется только при SHARED_CACHE).
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 10_000))
+AUTH_TOKEN_LOCAL_TIMEOUT = int(os.getenv('AUTH_TOKEN_LOCAL_TIMEOUT', 10))
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', 5 * 60))
+
+# Асинхронные обработчики чтения под ASGI (включаются в foodgram/asgi.py).
+# ORM работает в пуле из ASYNC_DB_WORKERS потоков на процесс, ещё
+# ASYNC_DB_BACKLOG запросов ждут в очереди, остальные получают 503.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'false').lower() == 'true'
+ASYNC_DB_WORKERS = int(os.getenv('ASYNC_DB_WORKERS', 8))
+ASYNC_DB_BACKLOG = int(os.getenv('ASYNC_DB_BACKLOG', 200))
+
+# Ленты подписок: до FEED_INLINE_LIMIT подписчиков (рецептов при подписке)
+# раскладка идёт в запросе, больше -- в фоне; записи вставляются пачками
+# по FEED_BATCH_SIZE, новому подписчику -- до FEED_BACKFILL_LIMIT рецептов.
+FEED_INLINE_LIMIT = int(os.getenv('FEED_INLINE_LIMIT', 200))
+FEED_BATCH_SIZE = int(os.getenv('FEED_BATCH_SIZE', 1000))
+FEED_BACKFILL_LIMIT = int(os.getenv('FEED_BACKFILL_LIMIT', 100))
+
+# Потоки для фоновых задач (копии картинок и т.п.).
+BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', 2))
+
+# Ширины уменьшенных копий картинок рецептов.
+RECIPE_IMAGE_WIDTHS = (160, 320, 640)
+
+# Шрифт с кириллицей для списка покупок в PDF.
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -148,7 +259,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 
     'DEFAULT_FILTER_BACKENDS': [
@@ -3,10 +3,14 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
-urlpatterns = [
+from api.async_views import async_read_routes
+from api.views import short_link_redirect
+
+urlpatterns = async_read_routes([
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
-]
+    path('s/<str:code>/', short_link_redirect, name='short-link'),
+], {'short-link'})
 
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL,
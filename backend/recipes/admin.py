@@ -24,7 +24,7 @@ class TagAdmin(admin.ModelAdmin):
 class RecipeAdmin(admin.ModelAdmin):
     """Админ-панель для управления объектами модели Recipe."""
 
-    list_display = ('author', 'name', 'pub_date')
+    list_display = ('author', 'name', 'pub_date', 'favorites_count')
     search_fields = ('name',)
     list_filter = ('pub_date', 'author')
 
@@ -0,0 +1,134 @@
+from itertools import islice
+
+from django.db import connection
+from django.db.models import F, Sum
+
+from recipes.models import (IngredientRecipe, Recipe, ShoppingCartItem,
+                            ShoppingList)
+
+BATCH_SIZE = 5000
+
+# Одна вставка с ON CONFLICT (PostgreSQL и SQLite 3.24+) прибавляет
+# изменения по ингредиентам к итогам всех выбранных списков покупок.
+APPLY_DELTAS_SQL = '''
+    INSERT INTO {items} (user_id, ingredient_id, amount)
+    SELECT cart.user_id, delta.column1, delta.column2
+    FROM {carts} AS cart CROSS JOIN (VALUES {values}) AS delta
+    WHERE cart.recipe_id = %s
+    ON CONFLICT (user_id, ingredient_id)
+    DO UPDATE SET amount = {items}.amount + excluded.amount
+'''
+APPLY_USER_DELTAS_SQL = '''
+    INSERT INTO {items} (user_id, ingredient_id, amount)
+    VALUES {values}
+    ON CONFLICT (user_id, ingredient_id)
+    DO UPDATE SET amount = {items}.amount + excluded.amount
+'''
+
+
+def apply_deltas(recipe_id, deltas):
+    """Прибавляет изменения {ингредиент: количество} к итогам всех
+    списков покупок, в которых лежит рецепт.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    params = [value for item in deltas.items() for value in item]
+    params.append(recipe_id)
+    with connection.cursor() as cursor:
+        cursor.execute(APPLY_DELTAS_SQL.format(
+            items=ShoppingCartItem._meta.db_table,
+            carts=ShoppingList._meta.db_table,
+            values=', '.join(['(%s, %s)'] * len(deltas)),
+        ), params)
+    if min(deltas.values()) < 0:
+        ShoppingCartItem.objects.filter(
+            user_id__in=ShoppingList.objects.filter(
+                recipe_id=recipe_id).values('user_id'),
+            amount__lte=0,
+        ).delete()
+
+
+def apply_user_deltas(user_id, deltas):
+    """Прибавляет изменения {ингредиент: количество} к итогам одного
+    списка покупок, не проверяя, какие рецепты в нём лежат.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    params = [value for pk, delta in deltas.items()
+              for value in (user_id, pk, delta)]
+    with connection.cursor() as cursor:
+        cursor.execute(APPLY_USER_DELTAS_SQL.format(
+            items=ShoppingCartItem._meta.db_table,
+            values=', '.join(['(%s, %s, %s)'] * len(deltas)),
+        ), params)
+    if min(deltas.values()) < 0:
+        ShoppingCartItem.objects.filter(
+            user_id=user_id, amount__lte=0).delete()
+
+
+def lock_recipes(recipe_ids):
+    """Блокирует рецепты до конца транзакции, всегда в порядке id.
+
+    Вызывается до чтения состава: изменения состава и добавления
+    в списки покупок одного рецепта идут по очереди, и разности
+    не считаются от одного и того же исходного состава.
+    """
+    list(Recipe.objects.select_for_update().filter(
+        pk__in=recipe_ids).order_by('pk').values_list('pk', flat=True))
+
+
+def get_composition(recipe_ids, sign=1):
+    """Суммарный состав рецептов одним запросом."""
+    return {
+        ingredient_id: sign * total
+        for ingredient_id, total in IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids,
+        ).values('ingredient_id').annotate(
+            total=Sum('amount'),
+        ).order_by().values_list('ingredient_id', 'total')
+    }
+
+
+def add_recipes(user_id, recipe_ids):
+    """Вызывается после добавления рецептов в список покупок."""
+    if recipe_ids:
+        lock_recipes(recipe_ids)
+        apply_user_deltas(user_id, get_composition(recipe_ids))
+
+
+def remove_recipes(user_id, recipe_ids):
+    """Вызывается после удаления рецептов из списка покупок."""
+    if recipe_ids:
+        lock_recipes(recipe_ids)
+        apply_user_deltas(user_id, get_composition(recipe_ids, -1))
+
+
+def remove_recipe_everywhere(recipe_id):
+    """Вызывается до удаления рецепта."""
+    lock_recipes((recipe_id,))
+    apply_deltas(recipe_id, get_composition((recipe_id,), -1))
+
+
+def expected_totals():
+    """Итоги, посчитанные заново из списков покупок: (user, ingredient)."""
+    return ShoppingList.objects.values(
+        'user_id',
+        ingredient_id=F('recipe__recipe_ingredients__ingredient_id'),
+    ).annotate(
+        total=Sum('recipe__recipe_ingredients__amount'),
+    ).filter(total__gt=0).order_by().values_list(
+        'user_id', 'ingredient_id', 'total').iterator()
+
+
+def rebuild_cart_totals():
+    """Заново заполняет итоги всех списков покупок."""
+    ShoppingCartItem.objects.all().delete()
+    totals = expected_totals()
+    while batch := list(islice(totals, BATCH_SIZE)):
+        ShoppingCartItem.objects.bulk_create([
+            ShoppingCartItem(
+                user_id=user_id, ingredient_id=ingredient_id, amount=total)
+            for user_id, ingredient_id, total in batch
+        ])
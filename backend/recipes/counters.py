@@ -0,0 +1,76 @@
+from django.apps import apps as global_apps
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+class CounterFieldsMixin:
+    """Полное сохранение объекта не перезаписывает счётчики
+    и производные поля.
+
+    Счётчики меняются только UPDATE с F(), производные поля (derived_fields)
+    -- фоновыми задачами и триггерами БД. Значения, прочитанные вместе
+    с объектом, к моменту save() могут устареть.
+    """
+
+    counter_fields = ()
+    derived_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not args and not self._state.adding
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.name not in self.derived_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+def get_new_value(field, delta):
+    """Не ниже нуля: строки, созданные в админке, shell или loaddata,
+    не увеличивают счётчики, и уменьшение иначе нарушило бы
+    ограничение положительного поля.
+    """
+    return Greatest(F(field) + delta, 0)
+
+
+def change_counter(model, pk, field, delta=1):
+    """Атомарно меняет счётчик на стороне БД, без гонок чтения-записи."""
+    model.objects.filter(pk=pk).update(**{field: get_new_value(field, delta)})
+
+
+def change_counters(model, pks, field, delta=1):
+    """То же для нескольких объектов одним UPDATE."""
+    if pks:
+        model.objects.filter(pk__in=pks).update(
+            **{field: get_new_value(field, delta)})
+
+
+def count_subquery(model, field):
+    """Количество строк model, ссылающихся полем field на внешний объект."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')}).order_by()
+            .values(field).annotate(total=Count('pk')).values('total')
+        ),
+        0,
+    )
+
+
+def rebuild_counters(apps=global_apps):
+    """Пересчитывает все счётчики двумя UPDATE с подзапросами."""
+    get_model = apps.get_model
+    recipe = get_model('recipes', 'Recipe')
+    get_model('users', 'User').objects.update(
+        recipes_count=count_subquery(recipe, 'author'),
+        followers_count=count_subquery(
+            get_model('recipes', 'Subscription'), 'author'),
+    )
+    recipe.objects.update(
+        favorites_count=count_subquery(
+            get_model('recipes', 'Favorite'), 'recipe'),
+        in_carts_count=count_subquery(
+            get_model('recipes', 'ShoppingList'), 'recipe'),
+    )
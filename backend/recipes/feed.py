@@ -0,0 +1,116 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+
+from recipes.models import FeedEntry, Recipe, Subscription
+from recipes.tasks import run_in_background
+from users.models import User
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def write_entries(entries):
+    for batch in batched(entries, settings.FEED_BATCH_SIZE):
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def locked_followers(author_id, user_ids):
+    """Подписчики из user_ids, чьи подписки на автора ещё существуют.
+
+    Строки подписок блокируются до конца транзакции: отписка ждёт
+    вставки в ленту и затем удаляет её, а уже удалённая подписка
+    не даёт ничего вставить.
+    """
+    return set(Subscription.objects.select_for_update().filter(
+        author_id=author_id, user_id__in=user_ids,
+    ).values_list('user_id', flat=True))
+
+
+def fan_out(recipe_id):
+    """Раскладывает рецепт по лентам подписчиков автора пачками."""
+    recipe = Recipe.objects.filter(pk=recipe_id).values(
+        'author_id', 'pub_date').first()
+    if recipe is None:
+        return
+    followers = Subscription.objects.filter(
+        author_id=recipe['author_id'],
+    ).values_list('user_id', flat=True).iterator(
+        chunk_size=settings.FEED_BATCH_SIZE)
+    for batch in batched(followers, settings.FEED_BATCH_SIZE):
+        with transaction.atomic():
+            FeedEntry.objects.bulk_create([
+                FeedEntry(user_id=user_id, recipe_id=recipe_id, **recipe)
+                for user_id in locked_followers(recipe['author_id'], batch)
+            ], ignore_conflicts=True)
+
+
+@transaction.atomic
+def backfill(user_id, author_id):
+    """Добавляет в ленту подписчика последние рецепты автора."""
+    if not locked_followers(author_id, (user_id,)):
+        return
+    recipes = Recipe.objects.filter(
+        author_id=author_id,
+    ).order_by('-pub_date').values_list(
+        'pk', 'pub_date')[:settings.FEED_BACKFILL_LIMIT]
+    write_entries((
+        FeedEntry(user_id=user_id, recipe_id=recipe_id, author_id=author_id,
+                  pub_date=pub_date)
+        for recipe_id, pub_date in recipes
+    ))
+
+
+def backfill_authors(user_id, author_ids):
+    for author_id in author_ids:
+        backfill(user_id, author_id)
+
+
+def prune(user_id, *author_ids):
+    """Убирает из ленты рецепты авторов после отписки."""
+    FeedEntry.objects.filter(
+        user_id=user_id, author_id__in=author_ids).delete()
+
+
+def publish(recipe):
+    """Раскладка нового рецепта: сразу или в фоне после коммита.
+
+    У автора с большим числом подписчиков раскладка идёт
+    вне обработки запроса. Число подписчиков читается из БД: автор
+    запроса мог прийти из кэша токенов.
+    """
+    followers_count = User.objects.values_list(
+        'followers_count', flat=True).get(pk=recipe.author_id)
+    if followers_count > settings.FEED_INLINE_LIMIT:
+        run_in_background(fan_out, recipe.pk)
+    else:
+        fan_out(recipe.pk)
+
+
+def subscribe(user_id, author):
+    """Заполнение ленты при подписке: сразу или в фоне после коммита."""
+    if author.recipes_count > settings.FEED_INLINE_LIMIT:
+        run_in_background(backfill, user_id, author.pk)
+    else:
+        backfill(user_id, author.pk)
+
+
+def subscribe_many(user_id, author_ids):
+    """Заполнение ленты при массовой подписке -- всегда в фоне.
+
+    Иначе стоимость запроса росла бы с числом авторов и их рецептов.
+    """
+    if author_ids:
+        run_in_background(backfill_authors, user_id, author_ids)
+
+
+def rebuild_feed():
+    """Заново заполняет ленты всех подписчиков."""
+    FeedEntry.objects.all().delete()
+    for user_id, author_id in Subscription.objects.values_list(
+            'user_id', 'author_id').iterator():
+        backfill(user_id, author_id)
@@ -0,0 +1,74 @@
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, features
+
+from api.cache import invalidate_recipes
+
+from .models import Recipe
+
+DERIVATIVES_DIR = 'media/derivatives'
+WEBP_FORMAT = 'WEBP'
+
+
+def get_formats(image):
+    formats = [image.format]
+    if image.format != WEBP_FORMAT and features.check('webp'):
+        formats.append(WEBP_FORMAT)
+    return formats
+
+
+def save_derivative(image, stem, width, image_format):
+    resized = image.copy()
+    resized.thumbnail((width, width * image.height // image.width))
+    if image_format == 'JPEG' and resized.mode not in ('RGB', 'L'):
+        resized = resized.convert('RGB')
+    buffer = BytesIO()
+    resized.save(buffer, format=image_format, optimize=True)
+    name = f'{DERIVATIVES_DIR}/{stem}_{width}.{image_format.lower()}'
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def generate_derivatives(recipe_id, stale_paths=()):
+    """Уменьшенные копии картинки рецепта в исходном формате и WebP.
+
+    Результат сохраняется, только если картинка не сменилась,
+    пока копии строились. Возвращает True, если копии сохранены.
+    """
+    delete_derivatives(stale_paths)
+    recipe = Recipe.objects.filter(pk=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return False
+    with recipe.image.open('rb') as file, Image.open(file) as image:
+        image.load()
+        stem = PurePosixPath(recipe.image.name).stem
+        derivatives = {
+            str(width): {
+                image_format.lower(): save_derivative(
+                    image, stem, width, image_format)
+                for image_format in get_formats(image)
+            }
+            for width in settings.RECIPE_IMAGE_WIDTHS
+            if width < image.width
+        }
+    updated = Recipe.objects.filter(
+        pk=recipe_id, image=recipe.image.name
+    ).update(image_derivatives=derivatives)
+    if updated:
+        invalidate_recipes(recipe_id)
+    else:
+        delete_derivatives(get_paths(derivatives))
+    return bool(updated)
+
+
+def get_paths(derivatives):
+    return [path for formats in derivatives.values()
+            for path in formats.values()]
+
+
+def delete_derivatives(paths):
+    for path in paths:
+        default_storage.delete(path)
@@ -0,0 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_derivatives, get_paths
+from recipes.models import Recipe
+from recipes.tasks import run_task
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии картинок у существующих рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Пересоздать копии и у обработанных.')
+        parser.add_argument('--workers', type=int,
+                            default=settings.BACKGROUND_WORKERS)
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_derivatives={})
+        jobs = [
+            (pk, get_paths(derivatives) if options['all'] else ())
+            for pk, derivatives in recipes.values_list(
+                'pk', 'image_derivatives').iterator()
+        ]
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            done = sum(bool(result) for result in executor.map(
+                lambda job: run_task(generate_derivatives, *job), jobs))
+        message = f'Обработано рецептов: {done} из {len(jobs)}.'
+        if done < len(jobs):
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,97 @@
+import csv
+import json
+import re
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.constants import MEASUREMENT_UNIT_LENGTH, NAME_MAX_LENGTH
+from api.ingredient_index import invalidate_ingredient_index
+from recipes.models import Ingredient
+
+DEFAULT_CATALOG = settings.BASE_DIR.parent / 'data' / 'ingredients.csv'
+READ_CHUNK_SIZE = 64 * 1024
+NOT_WHITESPACE = re.compile(r'\S|$')
+
+
+def iter_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def iter_json(file):
+    """Потоковый разбор JSON-массива объектов без чтения файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    while True:
+        chunk = file.read(READ_CHUNK_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            position = NOT_WHITESPACE.search(buffer, position).start()
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != '[':
+                    raise CommandError('Ожидается JSON-массив ингредиентов.')
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ',':
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item['name'], item['measurement_unit']
+        if not chunk:
+            raise CommandError('Файл JSON обрывается до конца массива.')
+
+
+READERS = {'.csv': iter_csv, '.json': iter_json}
+
+
+class Command(BaseCommand):
+    help = ('Загружает каталог ингредиентов из CSV или JSON. '
+            'Повторный запуск не создаёт дубликатов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_CATALOG)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json.')
+        started = time.perf_counter()
+        count_before = Ingredient.objects.count()
+        processed = 0
+        with open(path, encoding='utf-8') as file:
+            rows = (
+                Ingredient(
+                    name=name.strip()[:NAME_MAX_LENGTH],
+                    measurement_unit=unit.strip()[:MEASUREMENT_UNIT_LENGTH],
+                )
+                for name, unit in reader(file)
+                if name.strip()
+            )
+            while batch := list(islice(rows, options['batch_size'])):
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                processed += len(batch)
+        invalidate_ingredient_index()
+        elapsed = time.perf_counter() - started
+        created = Ingredient.objects.count() - count_before
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано {processed} строк, добавлено {created} '
+            f'за {elapsed:.2f} с ({processed / elapsed:.0f} строк/с).'
+        ))
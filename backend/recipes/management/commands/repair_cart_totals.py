@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.cart import expected_totals, rebuild_cart_totals
+from recipes.models import ShoppingCartItem
+
+
+class Command(BaseCommand):
+    help = ('Сверяет итоги списков покупок с самими списками '
+            'и при расхождениях пересобирает их.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только проверить, ничего не меняя; '
+                                 'при расхождениях команда завершится '
+                                 'с ошибкой.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            stored = {
+                (user_id, ingredient_id): amount
+                for user_id, ingredient_id, amount in
+                ShoppingCartItem.objects.values_list(
+                    'user_id', 'ingredient_id', 'amount').iterator()
+            }
+            mismatched = set()
+            for user_id, ingredient_id, total in expected_totals():
+                if stored.pop((user_id, ingredient_id), None) != total:
+                    mismatched.add(user_id)
+            mismatched.update(user_id for user_id, _ in stored)
+            if not mismatched:
+                self.stdout.write(self.style.SUCCESS(
+                    'Итоги списков покупок сходятся.'))
+                return
+            message = f'Расхождения у пользователей: {len(mismatched)}.'
+            if options['check']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+            rebuild_cart_totals()
+            self.stdout.write(self.style.SUCCESS(
+                'Итоги списков покупок пересобраны.'))
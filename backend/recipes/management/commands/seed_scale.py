@@ -0,0 +1,231 @@
+import random
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.cache import invalidate_catalog
+from api.constants import AMOUNT_INGREDIENT_MAX, AMOUNT_INGREDIENT_MIN
+from api.ingredient_index import invalidate_ingredient_index
+from recipes.cart import rebuild_cart_totals
+from recipes.counters import rebuild_counters
+from recipes.feed import rebuild_feed
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingList, Subscription, Tag)
+
+User = get_user_model()
+
+SEED_IMAGE = 'media/seed.gif'
+# Прозрачный GIF 1x1.
+SEED_IMAGE_CONTENT = (
+    b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04'
+    b'\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D'
+    b'\x01\x00;'
+)
+SEED_PASSWORD = 'seed-password'
+PUBLICATION_PERIOD = timedelta(days=3 * 365)
+
+
+def zipf_weights(size, exponent):
+    """Накопленные веса закона Ципфа: первые элементы самые популярные."""
+    return list(accumulate(1 / (rank + 1) ** exponent
+                           for rank in range(size)))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+@contextmanager
+def explicit_pub_date():
+    """bulk_create не перезаписывает pub_date текущим временем."""
+    field = Recipe._meta.get_field('pub_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = ('Генерирует синтетические данные с неравномерным '
+            'распределением для нагрузочных замеров.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument('--ingredients', type=int, default=2000,
+                            help='Создаётся, если каталог пуст.')
+        parser.add_argument('--max-ingredients-per-recipe', type=int,
+                            default=10)
+        parser.add_argument('--favorites', type=int, default=None,
+                            help='По умолчанию 3 на рецепт.')
+        parser.add_argument('--carts', type=int, default=None,
+                            help='По умолчанию 1 на рецепт.')
+        parser.add_argument('--subscriptions', type=int, default=None,
+                            help='По умолчанию 5 на пользователя.')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель закона Ципфа.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.skew = options['skew']
+        self.token = f'{int(time.time() * 1000):x}'
+        started = time.perf_counter()
+
+        user_ids = self.create_users(options['users'])
+        tag_ids = self.get_tag_ids(options['tags'])
+        ingredient_ids = self.get_ingredient_ids(options['ingredients'])
+        recipe_ids = self.create_recipes(options['recipes'], user_ids)
+        self.create_compositions(
+            recipe_ids, tag_ids, ingredient_ids,
+            options['max_ingredients_per_recipe'])
+        favorites = options['favorites']
+        carts = options['carts']
+        subscriptions = options['subscriptions']
+        self.create_pairs(
+            Favorite, 'recipe_id', user_ids, recipe_ids,
+            3 * len(recipe_ids) if favorites is None else favorites)
+        self.create_pairs(
+            ShoppingList, 'recipe_id', user_ids, recipe_ids,
+            len(recipe_ids) if carts is None else carts)
+        self.create_pairs(
+            Subscription, 'author_id', user_ids, user_ids,
+            5 * len(user_ids) if subscriptions is None else subscriptions)
+
+        self.stage('Счётчики', rebuild_counters)
+        self.stage('Ленты подписок', rebuild_feed)
+        self.stage('Итоги списков покупок', rebuild_cart_totals)
+        invalidate_catalog()
+        invalidate_ingredient_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - started:.1f} с.'))
+
+    def stage(self, title, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        self.stdout.write(
+            f'{title}: {time.perf_counter() - started:.1f} с')
+        return result
+
+    def ids(self, queryset):
+        return array('q', queryset.values_list('pk', flat=True).iterator())
+
+    def create_users(self, count):
+        password = make_password(SEED_PASSWORD)
+        users = (
+            User(
+                email=f'seed-{self.token}-{number}@example.com',
+                username=f'seed-{self.token}-{number}',
+                first_name='Seed',
+                last_name=str(number),
+                password=password,
+            )
+            for number in range(count)
+        )
+        self.stage(f'Пользователи ({count})', self.bulk_create, User, users)
+        return self.ids(User.objects.filter(
+            username__startswith=f'seed-{self.token}-'))
+
+    def get_tag_ids(self, count):
+        existing = Tag.objects.count()
+        Tag.objects.bulk_create(
+            Tag(name=f'seed-{number}', slug=f'seed-{number}')
+            for number in range(existing, count)
+        )
+        return self.ids(Tag.objects.all())
+
+    def get_ingredient_ids(self, count):
+        if not Ingredient.objects.exists():
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=f'seed-{number}', measurement_unit='г')
+                 for number in range(count)),
+                batch_size=self.batch_size,
+            )
+        return self.ids(Ingredient.objects.all())
+
+    def create_recipes(self, count, user_ids):
+        now = timezone.now()
+        author_weights = zipf_weights(len(user_ids), self.skew)
+        authors = self.random.choices(
+            user_ids, cum_weights=author_weights, k=count)
+        if not default_storage.exists(SEED_IMAGE):
+            default_storage.save(SEED_IMAGE, ContentFile(SEED_IMAGE_CONTENT))
+        recipes = (
+            Recipe(
+                author_id=author_id,
+                name=f'seed-{self.token}-{number}',
+                image=SEED_IMAGE,
+                text='Синтетический рецепт для нагрузочных замеров.',
+                cooking_time=self.random.randint(5, 180),
+                pub_date=now - PUBLICATION_PERIOD * self.random.random(),
+            )
+            for number, author_id in enumerate(authors)
+        )
+        with explicit_pub_date():
+            self.stage(
+                f'Рецепты ({count})', self.bulk_create, Recipe, recipes)
+        return self.ids(Recipe.objects.filter(
+            name__startswith=f'seed-{self.token}-'))
+
+    def create_compositions(self, recipe_ids, tag_ids, ingredient_ids,
+                            max_ingredients):
+        recipe_tags = (
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in self.random.sample(
+                tag_ids, self.random.randint(1, min(3, len(tag_ids))))
+        )
+        self.stage('Теги рецептов', self.bulk_create,
+                   Recipe.tags.through, recipe_tags)
+        ingredient_weights = zipf_weights(len(ingredient_ids), self.skew)
+        compositions = (
+            IngredientRecipe(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=self.random.randint(
+                    AMOUNT_INGREDIENT_MIN, AMOUNT_INGREDIENT_MAX),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in set(self.random.choices(
+                ingredient_ids, cum_weights=ingredient_weights,
+                k=self.random.randint(1, max_ingredients)))
+        )
+        self.stage('Состав рецептов', self.bulk_create,
+                   IngredientRecipe, compositions)
+
+    def create_pairs(self, model, target_field, user_ids, target_ids, count):
+        """Пары пользователь -- объект: популярные объекты встречаются
+        чаще, дубликаты отбрасывает ignore_conflicts.
+        """
+        target_weights = zipf_weights(len(target_ids), self.skew)
+        pairs = (
+            model(user_id=user_id, **{target_field: target_id})
+            for user_id, target_id in zip(
+                (self.random.choice(user_ids) for _ in range(count)),
+                (self.random.choices(
+                    target_ids, cum_weights=target_weights)[0]
+                 for _ in range(count)),
+            )
+            if user_id != target_id or target_field != 'author_id'
+        )
+        self.stage(f'{model._meta.verbose_name_plural} ({count})',
+                   self.bulk_create, model, pairs)
+
+    def bulk_create(self, model, objects):
+        for batch in batched(objects, self.batch_size):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.3 on 2026-10-17 07:04
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')}).order_by()
+            .values(field).annotate(total=Count('pk')).values('total')
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    """Копия recipes.counters.rebuild_counters на момент миграции."""
+    get_model = apps.get_model
+    recipe = get_model('recipes', 'Recipe')
+    get_model('users', 'User').objects.update(
+        recipes_count=count_subquery(recipe, 'author'),
+        followers_count=count_subquery(
+            get_model('recipes', 'Subscription'), 'author'),
+    )
+    recipe.objects.update(
+        favorites_count=count_subquery(
+            get_model('recipes', 'Favorite'), 'recipe'),
+        in_carts_count=count_subquery(
+            get_model('recipes', 'ShoppingList'), 'recipe'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_initial'),
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 3.2.3 on 2026-10-17 07:05
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Сливает ингредиенты с одинаковыми названием и единицей измерения.
+
+    Остаётся ингредиент с наименьшим id, рецепты переводятся на него;
+    если в рецепте были оба дубля, количества складываются.
+    """
+    ingredient = apps.get_model('recipes', 'Ingredient')
+    ingredient_recipe = apps.get_model('recipes', 'IngredientRecipe')
+    duplicates = ingredient.objects.values(
+        'name', 'measurement_unit',
+    ).annotate(kept_id=Min('id'), total=Count('id')).filter(total__gt=1)
+    for group in duplicates.iterator():
+        extra_ids = list(ingredient.objects.filter(
+            name=group['name'],
+            measurement_unit=group['measurement_unit'],
+        ).exclude(pk=group['kept_id']).values_list('pk', flat=True))
+        kept_rows = {
+            row.recipe_id: row
+            for row in ingredient_recipe.objects.filter(
+                ingredient_id=group['kept_id'])
+        }
+        for row in ingredient_recipe.objects.filter(
+                ingredient_id__in=extra_ids).order_by('pk'):
+            kept = kept_rows.get(row.recipe_id)
+            if kept is None:
+                row.ingredient_id = group['kept_id']
+                row.save(update_fields=['ingredient'])
+                kept_rows[row.recipe_id] = row
+            else:
+                kept.amount += row.amount
+                kept.save(update_fields=['amount'])
+                row.delete()
+        ingredient.objects.filter(pk__in=extra_ids).delete()
+
+
+class Migration(migrations.Migration):
+    # Слияние и ограничение -- в разных транзакциях: в PostgreSQL
+    # ALTER TABLE после изменения строк в той же транзакции падает
+    # с "pending trigger events".
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0003_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop,
+            atomic=True),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 3.2.3 on 2026-10-17 07:23
+
+from itertools import islice
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+BATCH_SIZE = 5000
+
+
+def fill_cart_totals(apps, schema_editor):
+    """Копия recipes.cart.rebuild_cart_totals на момент миграции."""
+    item = apps.get_model('recipes', 'ShoppingCartItem')
+    totals = apps.get_model('recipes', 'ShoppingList').objects.values(
+        'user_id',
+        ingredient_id=F('recipe__recipe_ingredients__ingredient_id'),
+    ).annotate(
+        total=Sum('recipe__recipe_ingredients__amount'),
+    ).filter(total__gt=0).order_by().values_list(
+        'user_id', 'ingredient_id', 'total').iterator()
+    while batch := list(islice(totals, BATCH_SIZE)):
+        item.objects.bulk_create([
+            item(user_id=user_id, ingredient_id=ingredient_id, amount=total)
+            for user_id, ingredient_id, total in batch
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0007_feedentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_items', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Итог списка покупок',
+                'verbose_name_plural': 'Итоги списков покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcartitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_cart_item'),
+        ),
+        migrations.RunPython(fill_cart_totals, migrations.RunPython.noop),
+    ]
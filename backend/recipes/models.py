@@ -1,3 +1,4 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 
@@ -5,6 +6,7 @@ from api.constants import (AMOUNT_INGREDIENT_MAX, AMOUNT_INGREDIENT_MIN,
                            MEASUREMENT_UNIT_LENGTH, NAME_MAX_LENGTH,
                            SLUG_LENGTH, TAG_LENGTH, СOOKING_TIME_MAX,
                            СOOKING_TIME_MIN)
+from recipes.counters import CounterFieldsMixin
 from users.models import User
 
 
@@ -24,6 +26,12 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -51,9 +59,12 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(CounterFieldsMixin, models.Model):
     """Хранение рецептов."""
 
+    counter_fields = ('favorites_count', 'in_carts_count')
+    derived_fields = ('image_derivatives', 'search_vector')
+
     author = models.ForeignKey(
         User,
         related_name='recipes',
@@ -69,6 +80,12 @@ class Recipe(models.Model):
         upload_to='media/',
         verbose_name='Картинка рецепта',
     )
+    image_derivatives = models.JSONField(
+        verbose_name='Уменьшенные копии картинки',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(
         verbose_name='Описание рецепта',
     )
@@ -101,12 +118,34 @@ class Recipe(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В списках покупок',
+        default=0,
+        editable=False
+    )
+    # Заполняется триггером PostgreSQL, GIN-индекс создаётся миграцией.
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False
+    )
 
     class Meta:
         ordering = ('-pub_date',)
         default_related_name = 'recipe'
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -234,3 +273,88 @@ class ShoppingList(models.Model):
 
     def __str__(self):
         return f'{self.recipe}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписчика, записывается при публикации."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор рецепта',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date'],
+                name='feed_user_pub_date'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_user_author'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.recipe}'
+
+
+class ShoppingCartItem(models.Model):
+    """Итог списка покупок пользователя по одному ингредиенту.
+
+    Поддерживается при изменении списка покупок и состава рецептов.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_items',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Ингредиент',
+    )
+    amount = models.IntegerField(
+        verbose_name='Количество',
+    )
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_cart_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient}'
@@ -0,0 +1,53 @@
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            TrigramSimilarity)
+from django.db import connections
+from django.db.models import F, Q
+
+from recipes.models import Ingredient
+
+# Конфигурация полнотекстового поиска; та же используется триггером
+# из миграции 0006_search.
+SEARCH_CONFIG = 'russian'
+
+
+def is_postgresql(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def search_recipes(queryset, query):
+    """Рецепты, в названии или описании которых встречается запрос.
+
+    В PostgreSQL поиск идёт по колонке search_vector с GIN-индексом,
+    результаты упорядочены по релевантности. На других базах --
+    простое вхождение каждого слова в название или описание.
+    """
+    if is_postgresql(queryset):
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query),
+        ).order_by('-search_rank', '-pub_date')
+    for word in query.split():
+        queryset = queryset.filter(
+            Q(name__icontains=word) | Q(text__icontains=word))
+    return queryset
+
+
+def search_ingredients(query, limit, exclude=()):
+    """Ингредиенты, содержащие запрос или похожие на него.
+
+    В PostgreSQL подстрока и опечатки ищутся по триграммному индексу,
+    ближайшие по написанию идут первыми. На других базах --
+    только вхождение подстроки.
+    """
+    queryset = Ingredient.objects.exclude(pk__in=exclude)
+    if is_postgresql(queryset):
+        queryset = queryset.filter(
+            Q(name__icontains=query) | Q(name__trigram_similar=query),
+        ).annotate(
+            similarity=TrigramSimilarity('name', query),
+        ).order_by('-similarity', 'name')
+    else:
+        queryset = queryset.filter(name__icontains=query).order_by('name')
+    return list(
+        queryset.values('id', 'name', 'measurement_unit')[:limit])
@@ -0,0 +1,28 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.BACKGROUND_WORKERS,
+    thread_name_prefix='foodgram-background',
+)
+
+
+def run_task(func, *args):
+    """Результат задачи или None, если она завершилась ошибкой."""
+    try:
+        return func(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s завершилась ошибкой',
+                         func.__name__)
+    finally:
+        connection.close()
+
+
+def run_in_background(func, *args):
+    """Выполняет задачу в ограниченном пуле потоков после коммита."""
+    transaction.on_commit(lambda: executor.submit(run_task, func, *args))
@@ -3,10 +3,17 @@ from django.db import models
 
 from api.constants import (EMAIL_MAX_LENGTH, FIRST_NAME_MAX_LENGTH,
                            LAST_NAME_MAX_LENGTH, USERNAME_MAX_LENGTH)
+from recipes.counters import CounterFieldsMixin
 
 
-class User(AbstractUser):
-    """Расширенная модель пользователя, наследующая от AbstractUser."""
+class User(CounterFieldsMixin, AbstractUser):
+    """Расширенная модель пользователя, наследующая от AbstractUser.
+
+    request.user может прийти из кэша токенов, поэтому save() без
+    update_fields не трогает счётчики.
+    """
+
+    counter_fields = ('recipes_count', 'followers_count')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name')
@@ -35,6 +42,16 @@ class User(AbstractUser):
         default=None,
         upload_to='profiles'
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         ordering = ('username',)